@@ -13,6 +13,7 @@ DYNAMODB_ENDPOINT_URL = os.getenv("DYNAMODB_ENDPOINT_URL", None)  # For local Dy
 USERS_TABLE = os.getenv("USERS_TABLE", "forum_users")
 DEFAULT_CHAT_MESSAGES_TABLE = os.getenv("CHAT_MESSAGES_TABLE", "main")
 CHAT_PREFIX = os.getenv("CHAT_PREFIX", "chat_")
+LOCKS_TABLE = os.getenv("LOCKS_TABLE", "forum_locks")  # leases of jobs only one replica may run
 
 # CloudWatch Configuration
 CLOUDWATCH_ENDPOINT_URL = os.getenv("CLOUDWATCH_ENDPOINT_URL", None)
@@ -23,3 +24,69 @@ CLOUDWATCH_LOG_STREAM = os.getenv("CLOUDWATCH_LOG_STREAM", "API-Access-Stream")
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+
+# Admin Configuration
+ADMIN_USERNAMES = {name.strip() for name in os.getenv("ADMIN_USERNAMES", "").split(",") if name.strip()}
+
+# Archive Configuration
+ARCHIVE_RETENTION_DAYS = int(os.getenv("ARCHIVE_RETENTION_DAYS", "0"))  # 0 disables the retention job
+ARCHIVE_INTERVAL_SECONDS = int(os.getenv("ARCHIVE_INTERVAL_SECONDS", "3600"))
+ARCHIVE_SEGMENT_MAX_MESSAGES = int(os.getenv("ARCHIVE_SEGMENT_MAX_MESSAGES", "5000"))
+ARCHIVE_BACKEND = os.getenv("ARCHIVE_BACKEND", "local")  # 'local' or 's3'
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+# Set once ARCHIVE_DIR is a volume every replica mounts and that survives restarts;
+# retention refuses to move messages into a local archive without it
+ARCHIVE_DIR_PERSISTENT = os.getenv("ARCHIVE_DIR_PERSISTENT", "false").lower() == "true"
+ARCHIVE_S3_BUCKET = os.getenv("ARCHIVE_S3_BUCKET", "forum-archive")
+ARCHIVE_S3_ENDPOINT_URL = os.getenv("ARCHIVE_S3_ENDPOINT_URL", None)
+
+# Export Configuration
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "100"))
+EXPORT_MAX_READ_UNITS = float(os.getenv("EXPORT_MAX_READ_UNITS", "1"))  # per second, per export
+
+# Write Sharding Configuration
+# Designated hot rooms and their initial write shard count, e.g. "main:4,announcements:2"
+HOT_ROOM_SHARDS = {
+    room.strip(): int(count)
+    for room, count in (
+        entry.split(":") for entry in os.getenv("HOT_ROOM_SHARDS", "").split(",") if entry.strip()
+    )
+}
+SHARD_LAYOUT_TTL_SECONDS = int(os.getenv("SHARD_LAYOUT_TTL_SECONDS", "30"))
+MAX_WRITE_SHARDS = int(os.getenv("MAX_WRITE_SHARDS", "16"))
+
+# Capacity Configuration
+DYNAMODB_READ_CAPACITY = float(os.getenv("DYNAMODB_READ_CAPACITY", "5"))  # provisioned RCU per table
+DYNAMODB_WRITE_CAPACITY = float(os.getenv("DYNAMODB_WRITE_CAPACITY", "5"))  # provisioned WCU per table
+CAPACITY_POD_SHARE = float(os.getenv("CAPACITY_POD_SHARE", "0.5"))  # share of each table this pod may use
+CAPACITY_BURST_SECONDS = float(os.getenv("CAPACITY_BURST_SECONDS", "5"))
+HISTORY_MAX_SCAN_PAGES = int(os.getenv("HISTORY_MAX_SCAN_PAGES", "200"))  # per table, for one page of older history
+
+# Request Coalescing Configuration
+COALESCE_METHODS = {
+    name.strip() for name in os.getenv(
+        "COALESCE_METHODS",
+        "get_user_by_username,get_user_by_email,get_recent_messages,check_table_status,get_chat_tables"
+    ).split(",") if name.strip()
+}
+
+# Search Configuration
+SEARCH_REFRESH_SECONDS = int(os.getenv("SEARCH_REFRESH_SECONDS", "3600"))  # picks up other pods' messages
+
+# Availability Check Configuration
+AVAILABILITY_REBUILD_SECONDS = int(os.getenv("AVAILABILITY_REBUILD_SECONDS", "900"))
+AVAILABILITY_FALSE_POSITIVE_RATE = float(os.getenv("AVAILABILITY_FALSE_POSITIVE_RATE", "0.01"))
+AVAILABILITY_MIN_CAPACITY = int(os.getenv("AVAILABILITY_MIN_CAPACITY", "10000"))  # users each filter is sized for
+
+# Admission Control Configuration
+ADMISSION_MAX_LOOP_LAG_MS = float(os.getenv("ADMISSION_MAX_LOOP_LAG_MS", "100"))  # 0 disables
+ADMISSION_MAX_EXECUTOR_QUEUE = int(os.getenv("ADMISSION_MAX_EXECUTOR_QUEUE", "64"))  # 0 disables
+ADMISSION_SAMPLE_INTERVAL_MS = int(os.getenv("ADMISSION_SAMPLE_INTERVAL_MS", "50"))
+ADMISSION_LAG_SAMPLES = int(os.getenv("ADMISSION_LAG_SAMPLES", "4"))  # consecutive lagging samples before shedding
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", "32"))
+
+# Conditional GET Configuration
+VERSION_TTL_SECONDS = int(os.getenv("VERSION_TTL_SECONDS", "15"))  # max staleness of changes made through other pods
+
+# WebSocket Session Configuration
+MAX_SESSION_ROOMS = int(os.getenv("MAX_SESSION_ROOMS", "50"))  # rooms one session may follow at once
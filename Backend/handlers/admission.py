@@ -0,0 +1,167 @@
+"""
+Admission control: shed new work while the event loop lags or the
+database executor backs up, lowest-priority routes first
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from fastapi.responses import JSONResponse
+from typing import Dict, Optional
+import asyncio
+import json
+import math
+import threading
+import time
+
+from config import (
+    ADMISSION_MAX_LOOP_LAG_MS, ADMISSION_MAX_EXECUTOR_QUEUE, ADMISSION_SAMPLE_INTERVAL_MS, ADMISSION_LAG_SAMPLES,
+    DB_EXECUTOR_WORKERS
+)
+
+# Request priorities, most important first
+CRITICAL = 0   # logins and chat messages
+NORMAL = 1     # everything not listed below
+POLLING = 2    # endpoints clients poll or can simply call again later
+
+# Load, as a multiple of the configured thresholds, at which a priority is shed
+SHED_AT = {CRITICAL: 4.0, NORMAL: 2.0, POLLING: 1.0}
+
+ROUTE_PRIORITIES = [
+    ("/api/token", CRITICAL),
+    ("/api/chat/list", POLLING),
+    ("/api/chat/status/", POLLING),
+    ("/api/chat/search", POLLING),
+    ("/api/chat/export/", POLLING),
+    ("/api/register/available", POLLING),
+    ("/api/chat/unread", POLLING),
+]
+
+OVERLOADED_DETAIL = "Server is overloaded, please retry"
+
+def route_priority(path: str) -> int:
+    for prefix, priority in ROUTE_PRIORITIES:
+        if path.startswith(prefix):
+            return priority
+    return NORMAL
+
+
+class TrackedExecutor(ThreadPoolExecutor):
+    """Thread pool that knows how many submitted calls are still waiting for a worker"""
+
+    def __init__(self, max_workers: int):
+        super().__init__(max_workers=max_workers, thread_name_prefix="dynamodb")
+        self.pending = 0
+        self._pending_lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        with self._pending_lock:
+            self.pending += 1
+        try:
+            future = super().submit(fn, *args, **kwargs)
+        except Exception:
+            self._done(None)
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self._pending_lock:
+            self.pending -= 1
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self.pending - self._max_workers)
+
+
+class AdmissionController:
+    """
+    Tracks event-loop lag and executor backlog, and decides whether new
+    work of a given priority is admitted. Load is the larger of both
+    signals relative to their thresholds; a threshold of 0 disables it.
+    """
+
+    def __init__(self):
+        self.executor: Optional[TrackedExecutor] = None
+        self.loop_lag = 0.0
+        self._lag_samples = deque(maxlen=max(1, ADMISSION_LAG_SAMPLES))
+        self.shed: Dict[int, int] = {priority: 0 for priority in SHED_AT}
+
+    def load(self) -> float:
+        load = 0.0
+        if ADMISSION_MAX_LOOP_LAG_MS > 0:
+            load = self.loop_lag * 1000 / ADMISSION_MAX_LOOP_LAG_MS
+        if ADMISSION_MAX_EXECUTOR_QUEUE > 0 and self.executor is not None:
+            load = max(load, self.executor.queue_depth / ADMISSION_MAX_EXECUTOR_QUEUE)
+        return load
+
+    def admit(self, priority: int) -> bool:
+        if self.load() < SHED_AT[priority]:
+            return True
+        self.shed[priority] += 1
+        return False
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.loop_lag))
+
+    def stats(self) -> dict:
+        return {
+            "loop_lag_ms": round(self.loop_lag * 1000, 1),
+            "executor_queue": self.executor.queue_depth if self.executor else 0,
+            "load": round(self.load(), 2),
+            "shed": {name: self.shed[priority] for name, priority in
+                     (("critical", CRITICAL), ("normal", NORMAL), ("polling", POLLING))}
+        }
+
+    async def monitor(self):
+        """Measure how late the loop wakes up from a short sleep"""
+        interval = ADMISSION_SAMPLE_INTERVAL_MS / 1000
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(interval)
+            self._lag_samples.append(max(0.0, time.monotonic() - started - interval))
+            # Only lag present in every recent sample counts: a single stall,
+            # such as one password hash, is over by the next sample
+            lag = min(self._lag_samples)
+            # React to sustained lag at once, recover gradually
+            self.loop_lag = lag if lag > self.loop_lag else 0.7 * self.loop_lag + 0.3 * lag
+
+admission = AdmissionController()
+
+
+class AdmissionMiddleware:
+    """ASGI middleware rejecting HTTP requests and WebSocket upgrades while overloaded"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket") or admission.admit(route_priority(scope["path"])):
+            await self.app(scope, receive, send)
+            return
+
+        retry_after = str(admission.retry_after())
+        if scope["type"] == "http":
+            response = JSONResponse(
+                status_code=503,
+                content={"detail": OVERLOADED_DETAIL},
+                headers={"Retry-After": retry_after}
+            )
+            await response(scope, receive, send)
+        elif "websocket.http.response" in scope.get("extensions", {}):
+            await send({
+                "type": "websocket.http.response.start",
+                "status": 503,
+                "headers": [(b"content-type", b"application/json"), (b"retry-after", retry_after.encode())]
+            })
+            await send({
+                "type": "websocket.http.response.body",
+                "body": json.dumps({"detail": OVERLOADED_DETAIL}).encode()
+            })
+        else:
+            # Servers without the denial response extension refuse the handshake
+            await send({"type": "websocket.close", "code": 1013})
+
+async def init_admission() -> asyncio.Task:
+    """Run blocking database calls on a tracked executor and start the lag monitor"""
+    admission.executor = TrackedExecutor(DB_EXECUTOR_WORKERS)
+    asyncio.get_event_loop().set_default_executor(admission.executor)
+    return asyncio.create_task(admission.monitor())
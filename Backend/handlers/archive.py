@@ -0,0 +1,322 @@
+"""
+Tiered retention: cold chat messages are moved out of DynamoDB into
+compressed, day-partitioned segment files with a small sidecar index
+"""
+from botocore.exceptions import ClientError
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Iterator
+import asyncio
+import gzip
+import heapq
+import json
+import os
+import time
+import uuid
+import boto3
+
+from schemas.models import ChatMessage
+from config import (
+    AWS_REGION, AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, CHAT_PREFIX,
+    ARCHIVE_RETENTION_DAYS, ARCHIVE_INTERVAL_SECONDS, ARCHIVE_SEGMENT_MAX_MESSAGES,
+    ARCHIVE_BACKEND, ARCHIVE_DIR, ARCHIVE_DIR_PERSISTENT, ARCHIVE_S3_BUCKET, ARCHIVE_S3_ENDPOINT_URL
+)
+
+SEGMENT_SUFFIX = ".jsonl.gz"
+RETENTION_LEASE = "archive-retention"
+# Identifies this process as the holder of the retention lease
+RETENTION_OWNER = uuid.uuid4().hex
+INDEX_SUFFIX = ".idx.json"
+INDEX_CACHE_SECONDS = 60
+
+
+class LocalSegmentStorage:
+    """Stores segments as files below a local directory"""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def initialize(self):
+        os.makedirs(self.root, exist_ok=True)
+
+    def put(self, key: str, data: bytes):
+        path = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def get(self, key: str) -> bytes:
+        with open(os.path.join(self.root, key), 'rb') as f:
+            return f.read()
+
+    def list(self, prefix: str) -> List[str]:
+        base = os.path.join(self.root, prefix)
+        keys = []
+        for directory, _, files in os.walk(base):
+            for name in files:
+                path = os.path.join(directory, name)
+                keys.append(os.path.relpath(path, self.root).replace(os.sep, '/'))
+        return keys
+
+
+class S3SegmentStorage:
+    """Stores segments as objects in an S3 (or S3-compatible) bucket"""
+
+    def __init__(self, bucket: str):
+        session_config = {
+            'region_name': AWS_REGION
+        }
+
+        if AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY:
+            session_config['aws_access_key_id'] = AWS_ACCESS_KEY_ID
+            session_config['aws_secret_access_key'] = AWS_SECRET_ACCESS_KEY
+
+        if ARCHIVE_S3_ENDPOINT_URL:
+            session_config['endpoint_url'] = ARCHIVE_S3_ENDPOINT_URL
+
+        self.s3_client = boto3.client('s3', **session_config)
+        self.bucket = bucket
+
+    def initialize(self):
+        try:
+            self.s3_client.head_bucket(Bucket=self.bucket)
+        except ClientError as e:
+            if e.response['Error']['Code'] not in ('404', 'NoSuchBucket'):
+                raise
+            bucket_config = {}
+            if AWS_REGION != 'us-east-1':
+                bucket_config['CreateBucketConfiguration'] = {'LocationConstraint': AWS_REGION}
+            self.s3_client.create_bucket(Bucket=self.bucket, **bucket_config)
+            print(f"Created archive bucket: {self.bucket}")
+
+    def put(self, key: str, data: bytes):
+        self.s3_client.put_object(Bucket=self.bucket, Key=key, Body=data)
+
+    def get(self, key: str) -> bytes:
+        return self.s3_client.get_object(Bucket=self.bucket, Key=key)['Body'].read()
+
+    def list(self, prefix: str) -> List[str]:
+        keys = []
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            keys.extend(obj['Key'] for obj in page.get('Contents', []))
+        return keys
+
+
+class ArchiveStore:
+    """
+    Reads and writes message segments. Each segment holds the messages of one
+    chat for one UTC day, sorted by timestamp, and has an index with its
+    time range so reads only decompress the segments they need.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+        self._indexes: Dict[str, tuple] = {}
+
+    async def initialize(self):
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self.storage.initialize)
+
+
+    def _segment_indexes_sync(self, chat: str) -> List[dict]:
+        """Returns the segment indexes of a chat, newest segment first"""
+        cached = self._indexes.get(chat)
+        if cached is not None and time.monotonic() - cached[0] < INDEX_CACHE_SECONDS:
+            return cached[1]
+
+        indexes = [
+            json.loads(self.storage.get(key))
+            for key in self.storage.list(f"{chat}/")
+            if key.endswith(INDEX_SUFFIX)
+        ]
+        indexes.sort(key=lambda index: index['max_ts'], reverse=True)
+        self._indexes[chat] = (time.monotonic(), indexes)
+        return indexes
+
+    def read_segment_sync(self, index: dict) -> List[ChatMessage]:
+        """Decompresses a segment and returns its messages in timestamp order"""
+        data = gzip.decompress(self.storage.get(index['key']))
+        return [
+            ChatMessage.from_dynamodb_item(json.loads(line))
+            for line in data.splitlines() if line
+        ]
+
+    def write_segment_sync(self, chat: str, messages: List[ChatMessage]) -> dict:
+        """Writes one segment of a single day's messages followed by its index"""
+        messages = sorted(messages, key=lambda msg: msg.timestamp)
+        day = messages[0].timestamp.strftime('%Y-%m-%d')
+        key = f"{chat}/{day}/{int(messages[0].timestamp.timestamp() * 1000)}-{uuid.uuid4().hex[:8]}{SEGMENT_SUFFIX}"
+
+        lines = (
+            json.dumps({
+                'message_id': msg.message_id,
+                'username': msg.username,
+                'message': msg.message,
+                'timestamp': msg.timestamp.isoformat()
+            })
+            for msg in messages
+        )
+        self.storage.put(key, gzip.compress("\n".join(lines).encode('utf-8')))
+
+        index = {
+            'key': key,
+            'chat': chat,
+            'day': day,
+            'count': len(messages),
+            'min_ts': messages[0].timestamp.timestamp(),
+            'max_ts': messages[-1].timestamp.timestamp()
+        }
+        self.storage.put(key.removesuffix(SEGMENT_SUFFIX) + INDEX_SUFFIX, json.dumps(index).encode('utf-8'))
+        self._indexes.pop(chat, None)
+        return index
+
+    def read_before_sync(self, chat: str, before: Optional[datetime], limit: int) -> List[ChatMessage]:
+        """Returns up to `limit` newest archived messages older than `before`, oldest first"""
+        before_ts = before.timestamp() if before else None
+        newest: List[tuple] = []
+        seen = set()
+
+        for index in self._segment_indexes_sync(chat):
+            if before_ts is not None and index['min_ts'] >= before_ts:
+                continue
+            if len(newest) >= limit and index['max_ts'] < newest[0][0]:
+                break
+            for msg in self.read_segment_sync(index):
+                ts = msg.timestamp.timestamp()
+                if (before_ts is not None and ts >= before_ts) or msg.message_id in seen:
+                    continue
+                seen.add(msg.message_id)
+                entry = (ts, msg.message_id, msg)
+                if len(newest) < limit:
+                    heapq.heappush(newest, entry)
+                elif entry[:2] > newest[0][:2]:
+                    heapq.heapreplace(newest, entry)
+
+        return [entry[2] for entry in sorted(newest, key=lambda entry: entry[:2])]
+
+    async def read_before(self, chat: str, before: Optional[datetime], limit: int) -> List[ChatMessage]:
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self.read_before_sync, chat, before, limit)
+
+    def segments_sync(
+        self,
+        chat: str,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None
+    ) -> List[dict]:
+        """Returns the indexes of segments overlapping the time range, oldest first"""
+        since_ts = since.timestamp() if since else None
+        until_ts = until.timestamp() if until else None
+        return sorted(
+            (
+                index for index in self._segment_indexes_sync(chat)
+                if (since_ts is None or index['max_ts'] >= since_ts)
+                and (until_ts is None or index['min_ts'] <= until_ts)
+            ),
+            key=lambda index: (index['min_ts'], index['key'])
+        )
+
+    def iter_messages_sync(
+        self,
+        chat: str,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None
+    ) -> Iterator[ChatMessage]:
+        """Yields archived messages of a chat in timestamp order, one segment at a time"""
+        since_ts = since.timestamp() if since else None
+        until_ts = until.timestamp() if until else None
+        seen = set()
+
+        for index in self.segments_sync(chat, since, until):
+            for msg in self.read_segment_sync(index):
+                ts = msg.timestamp.timestamp()
+                if since_ts is not None and ts < since_ts:
+                    continue
+                if until_ts is not None and ts > until_ts:
+                    continue
+                if msg.message_id in seen:
+                    continue
+                seen.add(msg.message_id)
+                yield msg
+
+
+    def compact_chat_sync(self, db, chat: str, cutoff: datetime) -> int:
+        """
+        Moves messages older than cutoff from the chat's tables into segments.
+        A segment is always written before its messages are deleted, so a crash
+        can only leave duplicates behind, which readers skip.
+        """
+        moved = 0
+        for table_name in db.chat_table_names_sync(chat):
+            buckets: Dict[str, List[ChatMessage]] = {}
+
+            def flush(day: str):
+                nonlocal moved
+                messages = buckets.pop(day)
+                self.write_segment_sync(chat, messages)
+                db.delete_messages_sync(table_name, [msg.message_id for msg in messages])
+                moved += len(messages)
+
+            for msg in db.iter_table_messages_sync(table_name, until=cutoff):
+                day = msg.timestamp.strftime('%Y-%m-%d')
+                buckets.setdefault(day, []).append(msg)
+                if len(buckets[day]) >= ARCHIVE_SEGMENT_MAX_MESSAGES:
+                    flush(day)
+
+            for day in list(buckets):
+                flush(day)
+        return moved
+
+
+def _create_storage():
+    if ARCHIVE_BACKEND == "s3":
+        return S3SegmentStorage(ARCHIVE_S3_BUCKET)
+    return LocalSegmentStorage(ARCHIVE_DIR)
+
+archive_store: ArchiveStore = ArchiveStore(_create_storage())
+
+async def run_retention(db):
+    """
+    Archive every chat's messages older than the retention period. Only the
+    replica holding the retention lease compacts; the lease is renewed before
+    each chat so a replica that stops renewing hands over to another one.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=ARCHIVE_RETENTION_DAYS)
+    loop = asyncio.get_event_loop()
+    lease_seconds = 2 * ARCHIVE_INTERVAL_SECONDS
+
+    for table in await db.get_chat_tables():
+        if not await db.acquire_lease(RETENTION_LEASE, RETENTION_OWNER, lease_seconds):
+            return
+        chat = table.removeprefix(CHAT_PREFIX)
+        try:
+            moved = await loop.run_in_executor(None, archive_store.compact_chat_sync, db, chat, cutoff)
+            if moved:
+                print(f"Archived {moved} messages from {table}")
+        except Exception as e:
+            print(f"Failed to archive {table}: {e}")
+
+async def retention_loop(db):
+    """Periodically run the retention job"""
+    while True:
+        try:
+            await run_retention(db)
+        except Exception as e:
+            print(f"Retention run failed: {e}")
+        await asyncio.sleep(ARCHIVE_INTERVAL_SECONDS)
+
+async def init_archive(db) -> Optional[asyncio.Task]:
+    """Prepare archive storage and start the retention job if enabled"""
+    await archive_store.initialize()
+    if ARCHIVE_RETENTION_DAYS <= 0:
+        return None
+    if ARCHIVE_BACKEND != "s3" and not ARCHIVE_DIR_PERSISTENT:
+        # Messages moved into one pod's filesystem are invisible to the other
+        # replicas and lost when the pod restarts
+        print("Retention disabled: the local archive needs ARCHIVE_DIR_PERSISTENT=true "
+              "with ARCHIVE_DIR on a shared persistent volume, or ARCHIVE_BACKEND=s3")
+        return None
+    await db.create_locks_table()
+    return asyncio.create_task(retention_loop(db))
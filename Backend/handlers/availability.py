@@ -0,0 +1,108 @@
+"""
+In-memory Bloom filters of taken usernames and emails, so availability
+checks only reach DynamoDB when a name might already be registered
+"""
+from hashlib import blake2b
+from typing import List, Optional, Tuple
+import asyncio
+import math
+
+from config import AVAILABILITY_REBUILD_SECONDS, AVAILABILITY_FALSE_POSITIVE_RATE, AVAILABILITY_MIN_CAPACITY
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter using double hashing over one blake2b digest"""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value: str):
+        digest = blake2b(value.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, value: str):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+class AvailabilityIndex:
+    """
+    Bloom filters of every registered username and email. A miss means the
+    value is definitely free on this pod's view of the users table; a hit
+    only means it might be taken. Users registered through other pods are
+    picked up by the periodic rebuild.
+    """
+
+    def __init__(self):
+        self.usernames: Optional[BloomFilter] = None
+        self.emails: Optional[BloomFilter] = None
+        self._rebuilding: Optional[List[Tuple[str, str]]] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.usernames is not None
+
+    def add(self, username: str, email: str):
+        """Record a newly registered user"""
+        if self.ready:
+            self.usernames.add(username)
+            self.emails.add(email.lower())
+        if self._rebuilding is not None:
+            self._rebuilding.append((username, email))
+
+    def username_may_exist(self, username: str) -> bool:
+        return not self.ready or username in self.usernames
+
+    def email_may_exist(self, email: str) -> bool:
+        return not self.ready or email.lower() in self.emails
+
+    def _build_sync(self, db) -> Tuple[BloomFilter, BloomFilter]:
+        users = list(db.iter_user_keys_sync())
+        # Leave room for registrations until the next rebuild resizes the filters
+        size = max(AVAILABILITY_MIN_CAPACITY, 2 * len(users))
+        usernames = BloomFilter(size, AVAILABILITY_FALSE_POSITIVE_RATE)
+        emails = BloomFilter(size, AVAILABILITY_FALSE_POSITIVE_RATE)
+        for username, email in users:
+            usernames.add(username)
+            emails.add(email.lower())
+        return usernames, emails
+
+    async def rebuild(self, db):
+        """Rebuild both filters from a scan of the users table without losing concurrent registrations"""
+        self._rebuilding = []
+        try:
+            loop = asyncio.get_event_loop()
+            usernames, emails = await loop.run_in_executor(None, self._build_sync, db)
+            for username, email in self._rebuilding:
+                usernames.add(username)
+                emails.add(email.lower())
+            self.usernames, self.emails = usernames, emails
+        finally:
+            self._rebuilding = None
+
+availability_index = AvailabilityIndex()
+
+async def rebuild_loop(db):
+    """
+    Build the filters, then periodically rebuild them to resize them and pick
+    up other pods' registrations. Until the first build finishes every check
+    falls through to DynamoDB.
+    """
+    while True:
+        try:
+            await availability_index.rebuild(db)
+        except Exception as e:
+            print(f"Failed to build availability filters: {e}")
+        await asyncio.sleep(AVAILABILITY_REBUILD_SECONDS)
+
+async def init_availability(db) -> asyncio.Task:
+    """Build the availability filters in the background and keep them fresh"""
+    return asyncio.create_task(rebuild_loop(db))
@@ -0,0 +1,256 @@
+"""
+Client-side capacity management for provisioned DynamoDB tables:
+adaptive per-table token buckets, priority classes and retry budgets
+"""
+from botocore.exceptions import ClientError, ConnectionError as BotoConnectionError, HTTPClientError
+from typing import Dict, Tuple
+import threading
+import asyncio
+import random
+import time
+
+from config import (
+    DYNAMODB_READ_CAPACITY, DYNAMODB_WRITE_CAPACITY, CAPACITY_POD_SHARE, CAPACITY_BURST_SECONDS
+)
+
+# Operation kinds
+READ = "read"
+WRITE = "write"
+
+# Priority classes, most important first
+LIVE = 0          # message writes and the user lookups every request depends on
+INTERACTIVE = 1   # history reads and other user-facing reads
+BULK = 2          # exports, index rebuilds and archiving
+
+# Fraction of a bucket each class must leave untouched for higher classes
+PRIORITY_RESERVE = {LIVE: 0.0, INTERACTIVE: 0.25, BULK: 0.5}
+# Longest a call may wait for capacity before failing fast
+PRIORITY_MAX_WAIT = {LIVE: 2.0, INTERACTIVE: 1.0, BULK: 30.0}
+PRIORITY_MAX_RETRIES = {LIVE: 3, INTERACTIVE: 2, BULK: 5}
+
+RETRYABLE_ERROR_CODES = {
+    'ProvisionedThroughputExceededException',
+    'ThrottlingException',
+    'RequestLimitExceeded',
+    'InternalServerError',
+    'ServiceUnavailable',
+}
+# Connection failures and read timeouts; botocore does not retry these on data-plane calls
+NETWORK_ERRORS = (BotoConnectionError, HTTPClientError)
+RETRY_BASE_DELAY = 0.05
+RETRY_MAX_DELAY = 2.0
+# Each request earns a tenth of a retry; a bucket can save up at most this many
+RETRY_BUDGET_RATIO = 0.1
+RETRY_BUDGET_MAX = 10.0
+# Assumed read cost of one scanned item until a table's real cost has been observed,
+# so the first page of a scan is a small probe
+DEFAULT_ITEM_COST = 1.0
+MAX_PAGE_ITEMS = 1000
+
+
+class CapacityExceededError(Exception):
+    """Raised when a call cannot get table capacity in time; the caller should degrade explicitly"""
+
+    def __init__(self, table_name: str, retry_after: float):
+        super().__init__(f"Capacity exceeded for table {table_name}")
+        self.table_name = table_name
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Capacity units of one table and operation kind. The refill rate starts at
+    this pod's share of the provisioned capacity, halves whenever DynamoDB
+    throttles and creeps back up on success. Costs are learned from the
+    ConsumedCapacity returned by each operation.
+    """
+
+    def __init__(self, table_name: str, provisioned: float):
+        self.table_name = table_name
+        self.max_rate = provisioned * CAPACITY_POD_SHARE
+        self.min_rate = self.max_rate * 0.1
+        self.rate = self.max_rate
+        self.capacity = self.max_rate * CAPACITY_BURST_SECONDS
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.estimates: Dict[str, float] = {}
+        self.item_costs: Dict[str, float] = {}
+        self.retry_tokens = RETRY_BUDGET_MAX
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, op: str, priority: int) -> float:
+        """Takes the estimated cost of `op` if allowed. Returns 0 on success, else seconds to wait."""
+        with self.lock:
+            self._refill()
+            floor = self.capacity * PRIORITY_RESERVE[priority]
+            if self.tokens > floor:
+                self.tokens -= self.estimates.get(op, 1.0)
+                return 0.0
+            return (floor - self.tokens) / self.rate + 0.001
+
+    def record(self, op: str, consumed: float, items: int = 0):
+        """Settles the difference between the estimated and the actual cost of `op`"""
+        with self.lock:
+            estimate = self.estimates.get(op, 1.0)
+            self.tokens -= consumed - estimate
+            self.estimates[op] = 0.8 * estimate + 0.2 * consumed
+            if items:
+                item_cost = self.item_costs.get(op)
+                observed = consumed / items
+                self.item_costs[op] = observed if item_cost is None else 0.8 * item_cost + 0.2 * observed
+
+    def page_limit(self, op: str, priority: int) -> int:
+        """
+        Number of items a scan page may read so that one page costs at most half
+        of what `priority` may use of a full bucket. Without it a single 1 MB page
+        (~128 RCU) would overdraw a small bucket for longer than any caller waits.
+        """
+        with self.lock:
+            budget = self.capacity * (1.0 - PRIORITY_RESERVE[priority]) / 2
+            item_cost = self.item_costs.get(op, DEFAULT_ITEM_COST)
+        return max(1, min(MAX_PAGE_ITEMS, int(budget / item_cost)))
+
+    def on_success(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+    def on_throttle(self):
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0.0)
+
+    def deposit_retry(self):
+        with self.lock:
+            self.retry_tokens = min(RETRY_BUDGET_MAX, self.retry_tokens + RETRY_BUDGET_RATIO)
+
+    def withdraw_retry(self) -> bool:
+        with self.lock:
+            if self.retry_tokens < 1.0:
+                return False
+            self.retry_tokens -= 1.0
+            return True
+
+    def retry_after(self) -> float:
+        with self.lock:
+            return max(1.0, -self.tokens / self.rate)
+
+
+class CapacityManager:
+    """Runs DynamoDB operations under the token bucket of the table they touch"""
+
+    def __init__(self):
+        self.buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        self.lock = threading.Lock()
+
+    def bucket(self, table_name: str, kind: str) -> TokenBucket:
+        key = (table_name, kind)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            with self.lock:
+                bucket = self.buckets.get(key)
+                if bucket is None:
+                    provisioned = DYNAMODB_READ_CAPACITY if kind == READ else DYNAMODB_WRITE_CAPACITY
+                    bucket = self.buckets[key] = TokenBucket(table_name, provisioned)
+        return bucket
+
+    def record(self, table_name: str, kind: str, op: str, response: dict):
+        """Feeds the ConsumedCapacity of a response back into the table's bucket"""
+        consumed = response.get('ConsumedCapacity')
+        if isinstance(consumed, list):
+            consumed = {'CapacityUnits': sum(entry.get('CapacityUnits', 0) for entry in consumed)}
+        if consumed:
+            items = response.get('ScannedCount', response.get('Count', 0))
+            self.bucket(table_name, kind).record(op, consumed.get('CapacityUnits', 0), items)
+
+    def page_limit(self, table_name: str, op: str, priority: int) -> int:
+        """Scan page size (Limit) that the table's read bucket can pay for"""
+        return self.bucket(table_name, READ).page_limit(op, priority)
+
+    def _deadline_exceeded(self, bucket: TokenBucket, wait: float, deadline: float):
+        if time.monotonic() + wait > deadline:
+            raise CapacityExceededError(bucket.table_name, max(1.0, wait))
+
+    def _should_retry(self, bucket: TokenBucket, error: Exception, priority: int, attempt: int) -> bool:
+        if isinstance(error, NETWORK_ERRORS):
+            print(f"DynamoDB request to {bucket.table_name} failed: {error} (attempt {attempt + 1})")
+            return attempt < PRIORITY_MAX_RETRIES[priority] and bucket.withdraw_retry()
+
+        if error.response['Error']['Code'] not in RETRYABLE_ERROR_CODES:
+            return False
+        self._throttled(bucket, priority, attempt)
+        return True
+
+    def _throttled(self, bucket: TokenBucket, priority: int, attempt: int):
+        """Slows the bucket down and spends a retry, or raises once the retries are used up"""
+        bucket.on_throttle()
+        print(f"DynamoDB throttled {bucket.table_name} (attempt {attempt + 1})")
+        if attempt >= PRIORITY_MAX_RETRIES[priority] or not bucket.withdraw_retry():
+            raise CapacityExceededError(bucket.table_name, bucket.retry_after())
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+    async def call(self, table_name: str, kind: str, priority: int, func, *args):
+        """Runs a sync DynamoDB operation in the executor once capacity is available"""
+        bucket = self.bucket(table_name, kind)
+        loop = asyncio.get_event_loop()
+        deadline = time.monotonic() + PRIORITY_MAX_WAIT[priority]
+        bucket.deposit_retry()
+        attempt = 0
+
+        while True:
+            wait = bucket.try_acquire(func.__name__, priority)
+            while wait:
+                self._deadline_exceeded(bucket, wait, deadline)
+                await asyncio.sleep(wait)
+                wait = bucket.try_acquire(func.__name__, priority)
+
+            try:
+                result = await loop.run_in_executor(None, func, *args)
+                bucket.on_success()
+                return result
+            except (ClientError,) + NETWORK_ERRORS as e:
+                if not self._should_retry(bucket, e, priority, attempt):
+                    raise
+            await asyncio.sleep(self._backoff(attempt))
+            attempt += 1
+
+    def call_sync(self, table_name: str, kind: str, priority: int, func, *args):
+        """Blocking variant of call() for operations already running on an executor thread"""
+        bucket = self.bucket(table_name, kind)
+        deadline = time.monotonic() + PRIORITY_MAX_WAIT[priority]
+        bucket.deposit_retry()
+        attempt = 0
+
+        while True:
+            wait = bucket.try_acquire(func.__name__, priority)
+            while wait:
+                self._deadline_exceeded(bucket, wait, deadline)
+                time.sleep(wait)
+                wait = bucket.try_acquire(func.__name__, priority)
+
+            try:
+                result = func(*args)
+                bucket.on_success()
+                return result
+            except (ClientError,) + NETWORK_ERRORS as e:
+                if not self._should_retry(bucket, e, priority, attempt):
+                    raise
+            time.sleep(self._backoff(attempt))
+            attempt += 1
+
+    def partially_throttled_sync(self, table_name: str, kind: str, priority: int, attempt: int):
+        """
+        For batch operations that came back with unprocessed items: treat it as
+        throttling and back off before the caller resubmits them through call_sync().
+        """
+        self._throttled(self.bucket(table_name, kind), priority, attempt)
+        time.sleep(self._backoff(attempt))
+
+
+capacity = CapacityManager()
@@ -0,0 +1,65 @@
+"""
+Single-flight coalescing: concurrent identical reads share one in-flight call
+"""
+from typing import Dict, Set
+from functools import wraps
+import asyncio
+import inspect
+
+from config import COALESCE_METHODS
+
+
+class SingleFlight:
+    def __init__(self, enabled: Set[str]):
+        self.enabled = enabled
+        self.inflight: Dict[tuple, asyncio.Task] = {}
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    def _forget(self, key: tuple, task: asyncio.Task):
+        if self.inflight.get(key) is task:
+            del self.inflight[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved even if every caller went away
+            task.exception()
+
+    async def do(self, method: str, key: tuple, factory):
+        """
+        Runs factory() unless an identical call is already in flight, in which
+        case its result (or exception) is shared. The shared call is shielded so
+        one caller disconnecting does not cancel it for the others.
+        """
+        if method not in self.enabled:
+            return await factory()
+
+        stats = self.stats.setdefault(method, {"calls": 0, "executed": 0, "coalesced": 0})
+        stats["calls"] += 1
+
+        full_key = (method,) + key
+        task = self.inflight.get(full_key)
+        if task is None:
+            stats["executed"] += 1
+            task = asyncio.ensure_future(factory())
+            self.inflight[full_key] = task
+            task.add_done_callback(lambda done: self._forget(full_key, done))
+        else:
+            stats["coalesced"] += 1
+
+        return await asyncio.shield(task)
+
+
+single_flight = SingleFlight(COALESCE_METHODS)
+
+def coalesced(func):
+    """
+    Decorator for async DynamoDBClient read methods. Callers of a coalesced
+    method receive the same result object and must not mutate it.
+    """
+    signature = inspect.signature(func)
+
+    @wraps(func)
+    async def run(self, *args, **kwargs):
+        bound = signature.bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        key = tuple(bound.arguments.values())[1:]
+        return await single_flight.do(func.__name__, key, lambda: func(self, *args, **kwargs))
+    return run
@@ -2,16 +2,42 @@
 Database initialization and connection management for DynamoDB
 """
 from botocore.exceptions import ClientError
-from typing import Optional, List
+from botocore.config import Config
+from boto3.dynamodb.conditions import Attr
+from typing import Optional, List, Iterator, Tuple
+from datetime import datetime
+from decimal import Decimal
 import asyncio
+import heapq
+import time
+import zlib
 import boto3
 
+from handlers.coalesce import coalesced
+from handlers.capacity import capacity, CapacityExceededError, READ, WRITE, LIVE, INTERACTIVE, BULK
+from handlers.archive import archive_store
+from handlers.search import search_index
+from handlers.availability import availability_index
+from handlers.versions import versions
+from handlers.unread import unread
 from schemas.models import User, ChatMessage
 from config import (
     AWS_REGION, AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY,
-    DYNAMODB_ENDPOINT_URL, USERS_TABLE, DEFAULT_CHAT_MESSAGES_TABLE, CHAT_PREFIX
+    DYNAMODB_ENDPOINT_URL, USERS_TABLE, DEFAULT_CHAT_MESSAGES_TABLE, CHAT_PREFIX, LOCKS_TABLE,
+    HOT_ROOM_SHARDS, SHARD_LAYOUT_TTL_SECONDS, HISTORY_MAX_SCAN_PAGES
 )
 
+SHARD_SEPARATOR = ".s"
+WRITE_SHARDS_TAG = "write_shards"
+SHARD_SPAN_TAG = "shard_span"
+
+def shard_table_name(chat: str, shard: int) -> str:
+    """Table holding one write shard of a chat. Shard 0 is the original chat table."""
+    table_name = f"{CHAT_PREFIX}{chat}"
+    if shard == 0:
+        return table_name
+    return f"{table_name}{SHARD_SEPARATOR}{shard}"
+
 class DynamoDBClient:
     def __init__(self):
         session_config = {
@@ -25,9 +51,14 @@ class DynamoDBClient:
         if DYNAMODB_ENDPOINT_URL:
             session_config['endpoint_url'] = DYNAMODB_ENDPOINT_URL
         
-        self.dynamodb = boto3.resource('dynamodb', **session_config)
-        self.client = self.dynamodb.meta.client
+        # Control-plane calls (tables, tags) keep botocore's standard retries
+        self.client = boto3.client('dynamodb', **session_config)
+        # Data-plane calls are retried by the capacity layer, which owns throttling
+        self.dynamodb = boto3.resource(
+            'dynamodb', config=Config(retries={'total_max_attempts': 1, 'mode': 'standard'}), **session_config
+        )
         self.users_table = self.dynamodb.Table(USERS_TABLE)
+        self._shard_layouts = {}
     
 
     def _create_users_tables_sync(self):
@@ -65,10 +96,53 @@ class DynamoDBClient:
         await loop.run_in_executor(None, self._create_users_tables_sync)
     
 
-    def _create_chat_tables_sync(self, chat: str):
-        """Create a new chat messages table and WAIT until it's ACTIVE"""
-        table_name = f"{CHAT_PREFIX}{chat}"
-        
+    def _create_locks_table_sync(self):
+        """Create the table of job leases and wait until active"""
+        try:
+            self.client.describe_table(TableName=LOCKS_TABLE)
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ResourceNotFoundException':
+                print(f"Creating table {LOCKS_TABLE}...")
+                self.client.create_table(
+                    TableName=LOCKS_TABLE,
+                    KeySchema=[{'AttributeName': 'name', 'KeyType': 'HASH'}],
+                    AttributeDefinitions=[{'AttributeName': 'name', 'AttributeType': 'S'}],
+                    ProvisionedThroughput={'ReadCapacityUnits': 1, 'WriteCapacityUnits': 1}
+                )
+
+                waiter = self.client.get_waiter('table_exists')
+                waiter.wait(TableName=LOCKS_TABLE, WaiterConfig={'Delay': 1, 'MaxAttempts': 20})
+                print(f"Table {LOCKS_TABLE} is now ACTIVE")
+
+    async def create_locks_table(self):
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self._create_locks_table_sync)
+
+    def _acquire_lease_sync(self, name: str, owner: str, seconds: int) -> bool:
+        """
+        Take or renew the named lease with a conditional write. Succeeds when
+        the lease is free, expired or already held by `owner`.
+        """
+        now = int(time.time())
+        try:
+            response = self.dynamodb.Table(LOCKS_TABLE).put_item(
+                Item={'name': name, 'owner': owner, 'expires_at': now + seconds},
+                ConditionExpression=Attr('name').not_exists() | Attr('expires_at').lt(now) | Attr('owner').eq(owner),
+                ReturnConsumedCapacity='TOTAL'
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return False
+            raise
+        capacity.record(LOCKS_TABLE, WRITE, '_acquire_lease_sync', response)
+        return True
+
+    async def acquire_lease(self, name: str, owner: str, seconds: int) -> bool:
+        return await capacity.call(LOCKS_TABLE, WRITE, BULK, self._acquire_lease_sync, name, owner, seconds)
+
+
+    def _create_chat_table_sync(self, table_name: str):
+        """Create a single chat messages table and WAIT until it's ACTIVE"""
         try:
             self.client.describe_table(TableName=table_name)
         except ClientError as e:
@@ -99,37 +173,122 @@ class DynamoDBClient:
                 waiter = self.client.get_waiter('table_exists')
                 waiter.wait(TableName=table_name, WaiterConfig={'Delay': 2, 'MaxAttempts': 30})
                 print(f"Table {table_name} is now READY.")
+
+    def _create_chat_tables_sync(self, chat: str):
+        """Create a new chat (and its shard tables if it is a designated hot room)"""
+        self._create_chat_table_sync(shard_table_name(chat, 0))
+        if chat in HOT_ROOM_SHARDS and self._read_shard_tags_sync(chat) is None:
+            self._set_write_shards_sync(chat, HOT_ROOM_SHARDS[chat])
                 
     async def create_chat_tables(self, chat: str):
         loop = asyncio.get_event_loop()
         await loop.run_in_executor(None, self._create_chat_tables_sync, chat)
+        versions.invalidate_chat_list()
 
 
-    def _check_table_status_sync(self, chat: str) -> str:
+    def _read_shard_tags_sync(self, chat: str) -> Optional[Tuple[int, int]]:
         """
-        Checks the status of a chat table and its indexes.
-        Returns: 'ACTIVE', 'CREATING', or 'NOT_FOUND'
+        Reads (write_shards, shard_span) from the tags of the chat's base table.
+        Returns None when the chat has never been sharded.
         """
-        table_name = f"{CHAT_PREFIX}{chat}"
-        
         try:
-            response = self.client.describe_table(TableName=table_name)
-            table_data = response['Table']
-            
-            if table_data['TableStatus'] != 'ACTIVE':
-                return table_data['TableStatus']
-
-            gsis = table_data.get('GlobalSecondaryIndexes', [])
-            for gsi in gsis:
-                if gsi['IndexStatus'] != 'ACTIVE':
-                    return "CREATING" 
-
-            return "ACTIVE"
+            table_arn = self.client.describe_table(TableName=shard_table_name(chat, 0))['Table']['TableArn']
         except ClientError as e:
             if e.response['Error']['Code'] == 'ResourceNotFoundException':
-                return "CREATING"
+                return None
             raise
 
+        tags = {
+            tag['Key']: tag['Value']
+            for tag in self.client.list_tags_of_resource(ResourceArn=table_arn).get('Tags', [])
+        }
+        if WRITE_SHARDS_TAG not in tags:
+            return None
+        write_shards = int(tags[WRITE_SHARDS_TAG])
+        return write_shards, max(write_shards, int(tags.get(SHARD_SPAN_TAG, write_shards)))
+
+    def _shard_layout_sync(self, chat: str) -> Tuple[int, int]:
+        """
+        Returns (write_shards, shard_span) of a chat, cached for SHARD_LAYOUT_TTL_SECONDS.
+        Writes go to the first write_shards tables; reads cover all shard_span tables,
+        so lowering the shard count never hides messages already written.
+        """
+        cached = self._shard_layouts.get(chat)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+
+        layout = self._read_shard_tags_sync(chat) or (1, 1)
+        self._shard_layouts[chat] = (time.monotonic() + SHARD_LAYOUT_TTL_SECONDS, layout)
+        return layout
+
+    async def shard_layout(self, chat: str) -> Tuple[int, int]:
+        cached = self._shard_layouts.get(chat)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self._shard_layout_sync, chat)
+
+    def chat_table_names_sync(self, chat: str) -> List[str]:
+        """All tables that may hold messages of a chat"""
+        _, span = self._shard_layout_sync(chat)
+        return [shard_table_name(chat, shard) for shard in range(span)]
+
+    async def chat_table_names(self, chat: str) -> List[str]:
+        _, span = await self.shard_layout(chat)
+        return [shard_table_name(chat, shard) for shard in range(span)]
+
+    def _set_write_shards_sync(self, chat: str, write_shards: int) -> Tuple[int, int]:
+        """
+        Changes the number of write shards of a chat without downtime.
+        New shard tables are created and ACTIVE before writes are routed to them.
+        """
+        current = self._read_shard_tags_sync(chat) or (1, 1)
+        span = max(current[1], write_shards)
+        for shard in range(span):
+            self._create_chat_table_sync(shard_table_name(chat, shard))
+
+        table_arn = self.client.describe_table(TableName=shard_table_name(chat, 0))['Table']['TableArn']
+        self.client.tag_resource(
+            ResourceArn=table_arn,
+            Tags=[
+                {'Key': WRITE_SHARDS_TAG, 'Value': str(write_shards)},
+                {'Key': SHARD_SPAN_TAG, 'Value': str(span)}
+            ]
+        )
+        layout = (write_shards, span)
+        self._shard_layouts[chat] = (time.monotonic() + SHARD_LAYOUT_TTL_SECONDS, layout)
+        return layout
+
+    async def set_write_shards(self, chat: str, write_shards: int) -> Tuple[int, int]:
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self._set_write_shards_sync, chat, write_shards)
+
+
+    def _check_table_status_sync(self, chat: str) -> str:
+        """
+        Checks the status of a chat's tables and their indexes.
+        Returns: 'ACTIVE', 'CREATING', or 'NOT_FOUND'
+        """
+        for table_name in self.chat_table_names_sync(chat):
+            try:
+                response = self.client.describe_table(TableName=table_name)
+                table_data = response['Table']
+
+                if table_data['TableStatus'] != 'ACTIVE':
+                    return table_data['TableStatus']
+
+                gsis = table_data.get('GlobalSecondaryIndexes', [])
+                for gsi in gsis:
+                    if gsi['IndexStatus'] != 'ACTIVE':
+                        return "CREATING"
+            except ClientError as e:
+                if e.response['Error']['Code'] == 'ResourceNotFoundException':
+                    return "CREATING"
+                raise
+
+        return "ACTIVE"
+
+    @coalesced
     async def check_table_status(self, chat: str) -> str:
         loop = asyncio.get_event_loop()
         return await loop.run_in_executor(None, self._check_table_status_sync, chat)
@@ -142,10 +301,14 @@ class DynamoDBClient:
         try:
             response = self.client.list_tables()
             tables = response.get('TableNames', [])
-            return [table for table in tables if table.startswith(CHAT_PREFIX)]
+            return [
+                table for table in tables
+                if table.startswith(CHAT_PREFIX) and SHARD_SEPARATOR not in table
+            ]
         except ClientError:
             return []
         
+    @coalesced
     async def get_chat_tables(self) -> List[str]:
         loop = asyncio.get_event_loop()
         return await loop.run_in_executor(None, self._get_chat_tables_sync)
@@ -154,24 +317,27 @@ class DynamoDBClient:
     def _create_user_sync(self, user: User) -> User:
         """Creates a new user in the users table."""
         item = user.to_dynamodb_item()
-        self.users_table.put_item(Item=item)
+        response = self.users_table.put_item(Item=item, ReturnConsumedCapacity='TOTAL')
+        capacity.record(USERS_TABLE, WRITE, '_create_user_sync', response)
         return user
     
     async def create_user(self, user: User) -> User:
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, self._create_user_sync, user)
+        await capacity.call(USERS_TABLE, WRITE, INTERACTIVE, self._create_user_sync, user)
+        availability_index.add(user.username, user.email)
+        return user
     
 
     def _get_user_by_username_sync(self, username: str) -> Optional[User]:
         """Retrieves a user by their username."""
-        response = self.users_table.get_item(Key={'username': username})
+        response = self.users_table.get_item(Key={'username': username}, ReturnConsumedCapacity='TOTAL')
+        capacity.record(USERS_TABLE, READ, '_get_user_by_username_sync', response)
         if 'Item' in response:
             return User.from_dynamodb_item(response['Item'])
         return None
     
+    @coalesced
     async def get_user_by_username(self, username: str) -> Optional[User]:
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, self._get_user_by_username_sync, username)
+        return await capacity.call(USERS_TABLE, READ, LIVE, self._get_user_by_username_sync, username)
     
 
     def _get_user_by_email_sync(self, email: str) -> Optional[User]:
@@ -179,54 +345,248 @@ class DynamoDBClient:
         response = self.users_table.query(
             IndexName='email-index',
             KeyConditionExpression='email = :email',
-            ExpressionAttributeValues={':email': email}
+            ExpressionAttributeValues={':email': email},
+            ReturnConsumedCapacity='TOTAL'
         )
+        capacity.record(USERS_TABLE, READ, '_get_user_by_email_sync', response)
         if response['Items']:
             return User.from_dynamodb_item(response['Items'][0])
         return None
     
+    @coalesced
     async def get_user_by_email(self, email: str) -> Optional[User]:
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, self._get_user_by_email_sync, email)
+        return await capacity.call(USERS_TABLE, READ, INTERACTIVE, self._get_user_by_email_sync, email)
+
+    def _scan_user_keys_page_sync(self, start_key: Optional[dict] = None, limit: Optional[int] = None) -> tuple:
+        """
+        Scans a single page of the users table, reading only usernames and emails.
+        Returns ([(username, email), ...], last_evaluated_key).
+        """
+        scan_kwargs = {
+            'ProjectionExpression': 'username, email',
+            'ReturnConsumedCapacity': 'TOTAL'
+        }
+        if limit is not None:
+            scan_kwargs['Limit'] = limit
+        if start_key is not None:
+            scan_kwargs['ExclusiveStartKey'] = start_key
+
+        response = self.users_table.scan(**scan_kwargs)
+        capacity.record(USERS_TABLE, READ, '_scan_user_keys_page_sync', response)
+        users = [(item['username'], item.get('email', '')) for item in response.get('Items', [])]
+        return users, response.get('LastEvaluatedKey')
+
+    def iter_user_keys_sync(self) -> Iterator[Tuple[str, str]]:
+        """Yields (username, email) of every registered user"""
+        start_key = None
+        while True:
+            limit = capacity.page_limit(USERS_TABLE, '_scan_user_keys_page_sync', BULK)
+            users, start_key = capacity.call_sync(
+                USERS_TABLE, READ, BULK, self._scan_user_keys_page_sync, start_key, limit
+            )
+            yield from users
+            if start_key is None:
+                return
     
 
-    def _create_message_sync(self, message: ChatMessage, chat: str) -> ChatMessage:
+    def _create_message_sync(self, message: ChatMessage, table_name: str) -> ChatMessage:
         """Creates a new chat message in the specified chat table."""
-        table_name = f"{CHAT_PREFIX}{chat}"
         table = self.dynamodb.Table(table_name)
         item = message.to_dynamodb_item()
         
         try:
-            table.put_item(Item=item)
+            response = table.put_item(Item=item, ReturnConsumedCapacity='TOTAL')
+            capacity.record(table_name, WRITE, '_create_message_sync', response)
             return message
         except ClientError as e:
             raise e
     
     async def create_message(self, message: ChatMessage, chat: str) -> ChatMessage:
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, self._create_message_sync, message, chat)
+        """Writes a message to one of the chat's write shards, chosen by message id"""
+        write_shards, _ = await self.shard_layout(chat)
+        shard = zlib.crc32(message.message_id.encode('utf-8')) % write_shards
+        table_name = shard_table_name(chat, shard)
+        message = await capacity.call(table_name, WRITE, LIVE, self._create_message_sync, message, table_name)
+        search_index.add(message, chat)
+        versions.message_written(chat, message)
+        unread.message_created(chat)
+        return message
     
 
-    def _get_recent_messages_sync(self, chat: str, limit: int = 50) -> List[ChatMessage]:
-        """Retrieves recent messages from a chat table."""
-        table_name = f"{CHAT_PREFIX}{chat}"
-
+    async def _get_recent_table_messages(
+        self,
+        table_name: str,
+        limit: int = 50,
+        before: Optional[datetime] = None
+    ) -> List[ChatMessage]:
+        """
+        Retrieves recent messages from a single chat table, oldest first.
+        With `before`, returns the newest messages strictly older than it.
+        Chat tables have no time index, so that is a scan of the whole table;
+        it runs at bulk priority, which may wait for capacity between pages,
+        and gives up after HISTORY_MAX_SCAN_PAGES pages.
+        """
         try:
-            self.client.describe_table(TableName=table_name)
-            table = self.dynamodb.Table(table_name)
-            response = table.scan(Limit=limit * 2)
-            items = response['Items']
-            items.sort(key=lambda x: float(x['timestamp_sort']), reverse=True)
-            items = items[:limit]
-            messages = [ChatMessage.from_dynamodb_item(item) for item in items]
-            messages.reverse()
-            return messages
-        except ClientError:
-            return []
+            if before is None:
+                messages, _, _ = await self.scan_table_page(table_name, limit=limit * 2, priority=INTERACTIVE)
+                messages.sort(key=lambda msg: msg.timestamp)
+                return messages[-limit:]
+
+            newest: List[ChatMessage] = []
+            start_key = None
+            for _ in range(HISTORY_MAX_SCAN_PAGES):
+                page, start_key, _ = await self.scan_table_page(
+                    table_name, start_key, until=before,
+                    limit=capacity.page_limit(table_name, '_scan_table_page_sync', BULK),
+                    priority=BULK
+                )
+                older = (msg for msg in newest + page if msg.timestamp < before)
+                newest = heapq.nlargest(limit, older, key=lambda msg: msg.timestamp)
+                if start_key is None:
+                    newest.reverse()
+                    return newest
+            raise CapacityExceededError(table_name, capacity.bucket(table_name, READ).retry_after())
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ResourceNotFoundException':
+                return []
+            raise
     
-    async def get_recent_messages(self, chat: str, limit: int = 50) -> List[ChatMessage]:
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, self._get_recent_messages_sync, chat, limit)
+    @coalesced
+    async def get_recent_messages(
+        self,
+        chat: str,
+        limit: int = 50,
+        before: Optional[datetime] = None
+    ) -> List[ChatMessage]:
+        """
+        Reads every shard of the chat in parallel and merges them by timestamp,
+        then falls through to the archive for older history.
+        Raises CapacityExceededError instead of returning a partial history.
+        """
+        tables = await self.chat_table_names(chat)
+        per_shard = await asyncio.gather(*(
+            self._get_recent_table_messages(table_name, limit, before)
+            for table_name in tables
+        ))
+        messages = list(heapq.merge(*per_shard, key=lambda msg: msg.timestamp))[-limit:]
+        if len(messages) >= limit:
+            return messages
+
+        oldest = messages[0].timestamp if messages else before
+        archived = await archive_store.read_before(chat, oldest, limit - len(messages))
+        hot_ids = {msg.message_id for msg in messages}
+        return [msg for msg in archived if msg.message_id not in hot_ids] + messages
+
+
+    def _delete_batch_sync(self, table_name: str, message_ids: List[str]) -> List[str]:
+        """Deletes up to 25 messages. Returns the ids DynamoDB left unprocessed."""
+        request = {
+            table_name: [{'DeleteRequest': {'Key': {'message_id': message_id}}} for message_id in message_ids]
+        }
+        response = self.dynamodb.meta.client.batch_write_item(RequestItems=request, ReturnConsumedCapacity='TOTAL')
+        capacity.record(table_name, WRITE, '_delete_batch_sync', response)
+        unprocessed = response.get('UnprocessedItems', {}).get(table_name, [])
+        return [item['DeleteRequest']['Key']['message_id'] for item in unprocessed]
+
+    def delete_messages_sync(self, table_name: str, message_ids: List[str]):
+        """
+        Deletes messages from a chat table in batches, at bulk priority.
+        Unprocessed items are resubmitted under the table's bucket and retry budget.
+        """
+        pending = list(message_ids)
+        attempt = 0
+        while pending:
+            batch, pending = pending[:25], pending[25:]
+            unprocessed = capacity.call_sync(table_name, WRITE, BULK, self._delete_batch_sync, table_name, batch)
+            if unprocessed:
+                capacity.partially_throttled_sync(table_name, WRITE, BULK, attempt)
+                pending = unprocessed + pending
+                attempt += 1
+            else:
+                attempt = 0
+
+
+    def _time_filter(self, since: Optional[datetime], until: Optional[datetime]):
+        """Builds a scan filter on timestamp_sort for an optional time range"""
+        condition = None
+        if since is not None:
+            condition = Attr('timestamp_sort').gte(Decimal(str(since.timestamp())))
+        if until is not None:
+            upper = Attr('timestamp_sort').lte(Decimal(str(until.timestamp())))
+            condition = upper if condition is None else condition & upper
+        return condition
+
+    def iter_table_messages_sync(
+        self,
+        table_name: str,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None
+    ) -> Iterator[ChatMessage]:
+        """
+        Yields every message of a single chat table, following scan pagination
+        at bulk priority. Optional since/until bounds are applied as a server-side filter.
+        """
+        start_key = None
+        while True:
+            limit = capacity.page_limit(table_name, '_scan_table_page_sync', BULK)
+            messages, start_key, _ = capacity.call_sync(
+                table_name, READ, BULK, self._scan_table_page_sync, table_name, start_key, since, until, limit
+            )
+            yield from messages
+            if start_key is None:
+                break
+
+    def iter_messages_sync(
+        self,
+        chat: str,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None
+    ) -> Iterator[ChatMessage]:
+        """Yields every message of a chat across all of its shard tables"""
+        for table_name in self.chat_table_names_sync(chat):
+            yield from self.iter_table_messages_sync(table_name, since, until)
+
+    def _scan_table_page_sync(
+        self,
+        table_name: str,
+        start_key: Optional[dict] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        limit: Optional[int] = None
+    ) -> tuple:
+        """
+        Scans a single page of a chat table.
+        Returns (messages, last_evaluated_key, consumed_read_units).
+        """
+        table = self.dynamodb.Table(table_name)
+        scan_kwargs = {'ReturnConsumedCapacity': 'TOTAL'}
+
+        condition = self._time_filter(since, until)
+        if condition is not None:
+            scan_kwargs['FilterExpression'] = condition
+        if start_key is not None:
+            scan_kwargs['ExclusiveStartKey'] = start_key
+        if limit is not None:
+            scan_kwargs['Limit'] = limit
+
+        response = table.scan(**scan_kwargs)
+        capacity.record(table_name, READ, '_scan_table_page_sync', response)
+        messages = [ChatMessage.from_dynamodb_item(item) for item in response.get('Items', [])]
+        consumed = response.get('ConsumedCapacity', {}).get('CapacityUnits', 0)
+        return messages, response.get('LastEvaluatedKey'), consumed
+
+    async def scan_table_page(
+        self,
+        table_name: str,
+        start_key: Optional[dict] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        limit: Optional[int] = None,
+        priority: int = BULK
+    ) -> tuple:
+        return await capacity.call(
+            table_name, READ, priority, self._scan_table_page_sync, table_name, start_key, since, until, limit
+        )
 
 
 db_client: Optional[DynamoDBClient] = None
@@ -237,6 +597,8 @@ async def init_db():
     db_client = DynamoDBClient()
     await db_client.create_users_tables()
     await db_client.create_chat_tables(DEFAULT_CHAT_MESSAGES_TABLE)
+    for room in HOT_ROOM_SHARDS:
+        await db_client.create_chat_tables(room)
     return db_client
 
 def get_db() -> DynamoDBClient:
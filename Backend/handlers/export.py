@@ -0,0 +1,183 @@
+"""
+Streaming NDJSON export of chat transcripts with read-rate pacing
+"""
+from typing import AsyncIterator, Optional
+from datetime import datetime
+import asyncio
+import base64
+import heapq
+import json
+import time
+import zlib
+
+from handlers.capacity import CapacityExceededError
+from handlers.archive import archive_store
+from schemas.models import ChatMessage
+from config import EXPORT_PAGE_SIZE, EXPORT_MAX_READ_UNITS
+
+
+def encode_export_cursor(state: dict) -> str:
+    """Encode the export position as an opaque cursor"""
+    return base64.urlsafe_b64encode(json.dumps(state).encode('utf-8')).decode('ascii')
+
+
+def _valid_start_key(start_key) -> bool:
+    """Chat tables are keyed by message_id alone, so is every scan position"""
+    return start_key is None or (
+        isinstance(start_key, dict) and set(start_key) == {'message_id'}
+        and isinstance(start_key['message_id'], str)
+    )
+
+
+def _valid_segment(segment) -> bool:
+    return segment is None or (
+        isinstance(segment, dict) and set(segment) == {'min_ts', 'key'}
+        and isinstance(segment['min_ts'], (int, float)) and isinstance(segment['key'], str)
+    )
+
+
+def decode_export_cursor(cursor: str) -> dict:
+    """Decode a cursor produced by encode_export_cursor. Raises ValueError if malformed."""
+    try:
+        state = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(state, dict):
+        raise ValueError("Invalid cursor")
+
+    if state.get('phase') == 'hot':
+        pending = state.get('pending')
+        valid = pending is None or (
+            isinstance(pending, dict)
+            and all(isinstance(table_name, str) and _valid_start_key(start_key)
+                    for table_name, start_key in pending.items())
+        )
+    elif state.get('phase') == 'archive':
+        valid = _valid_segment(state.get('segment'))
+    else:
+        valid = False
+    if not valid:
+        raise ValueError("Invalid cursor")
+    return state
+
+
+def cursor_tables(state: dict) -> set:
+    """Tables a decoded cursor resumes scanning"""
+    return set(state.get('pending') or ())
+
+
+def _line(record: dict) -> bytes:
+    return (json.dumps(record) + "\n").encode('utf-8')
+
+
+def _message_line(msg: ChatMessage) -> bytes:
+    return _line({
+        "type": "message",
+        "message_id": msg.message_id,
+        "username": msg.username,
+        "message": msg.message,
+        "timestamp": msg.timestamp.isoformat()
+    })
+
+
+class ReadPacer:
+    """Spaces out reads so an export consumes at most `units_per_second` read units"""
+
+    def __init__(self, units_per_second: float):
+        self.units_per_second = units_per_second
+        self.next_read = time.monotonic()
+
+    async def wait(self):
+        delay = self.next_read - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def consumed(self, units: float):
+        self.next_read = max(self.next_read, time.monotonic()) + units / self.units_per_second
+
+
+async def export_ndjson(
+    db,
+    chat: str,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    cursor: Optional[str] = None
+) -> AsyncIterator[bytes]:
+    """
+    Yields the transcript of a chat as NDJSON, one storage page at a time.
+    Each round reads one page from every shard table in parallel and merges
+    them by timestamp, but tables are scanned in key (hash) order, so the
+    transcript as a whole is not chronological: consumers sort by timestamp.
+    Hot table pages come first, then archive segments in time order, so a
+    message moved to the archive mid-export shows up twice rather than not
+    at all. A cursor line follows every page; passing it back resumes after
+    that page.
+    """
+    state = decode_export_cursor(cursor) if cursor else {'phase': 'hot', 'pending': None}
+    pacer = ReadPacer(EXPORT_MAX_READ_UNITS)
+
+    if state['phase'] == 'hot':
+        pending = state.get('pending')
+        if pending is None:
+            pending = {table_name: None for table_name in await db.chat_table_names(chat)}
+
+        while pending:
+            await pacer.wait()
+            try:
+                results = await asyncio.gather(*(
+                    db.scan_table_page(table_name, start_key, since, until, EXPORT_PAGE_SIZE)
+                    for table_name, start_key in pending.items()
+                ))
+            except CapacityExceededError as e:
+                yield _line({"type": "error", "detail": "Over capacity, resume from the last cursor", "retry_after": e.retry_after})
+                return
+
+            pages = []
+            for table_name, (messages, last_key, consumed) in zip(list(pending), results):
+                pacer.consumed(consumed)
+                pages.append(sorted(messages, key=lambda msg: msg.timestamp))
+                if last_key is None:
+                    del pending[table_name]
+                else:
+                    pending[table_name] = last_key
+
+            if pending:
+                state = {'phase': 'hot', 'pending': pending}
+            else:
+                state = {'phase': 'archive', 'segment': None}
+
+            page = [_message_line(msg) for msg in heapq.merge(*pages, key=lambda msg: msg.timestamp)]
+            page.append(_line({"type": "cursor", "cursor": encode_export_cursor(state)}))
+            yield b"".join(page)
+
+    loop = asyncio.get_event_loop()
+    segments = await loop.run_in_executor(None, archive_store.segments_sync, chat, since, until)
+    if state.get('segment'):
+        position = (state['segment']['min_ts'], state['segment']['key'])
+        segments = [index for index in segments if (index['min_ts'], index['key']) > position]
+
+    since_ts = since.timestamp() if since else None
+    until_ts = until.timestamp() if until else None
+    for index in segments:
+        messages = await loop.run_in_executor(None, archive_store.read_segment_sync, index)
+        page = [
+            _message_line(msg) for msg in messages
+            if (since_ts is None or msg.timestamp.timestamp() >= since_ts)
+            and (until_ts is None or msg.timestamp.timestamp() <= until_ts)
+        ]
+
+        state = {'phase': 'archive', 'segment': {'min_ts': index['min_ts'], 'key': index['key']}}
+        page.append(_line({"type": "cursor", "cursor": encode_export_cursor(state)}))
+        yield b"".join(page)
+
+    yield _line({"type": "end"})
+
+
+async def gzip_stream(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Gzip-compresses a byte stream, flushing after every page so output stays incremental"""
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    async for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
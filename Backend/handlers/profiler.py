@@ -0,0 +1,147 @@
+"""
+On-demand sampling profiler producing flame-graph compatible folded stacks.
+Nothing runs while no profile is being captured; request and WebSocket
+handlers only pay for one attribute check.
+"""
+from collections import Counter
+from contextlib import nullcontext
+from typing import Dict, Optional
+import asyncio
+import threading
+import time
+import sys
+
+NULL_SCOPE = nullcontext()
+MAX_STACK_DEPTH = 128
+
+
+class ProfileSession:
+    """One capture: either the next `requests` tracked requests or the next `seconds` seconds"""
+
+    def __init__(self, seconds: Optional[float], requests: Optional[int], interval: float):
+        self.seconds = seconds
+        self.remaining_requests = requests
+        self.interval = interval
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.active = 0
+        self.samples = 0
+        self.wall: Counter = Counter()
+        self.cpu: Counter = Counter()
+        self.lock = threading.Lock()
+
+    def status(self) -> dict:
+        return {
+            "status": "finished" if self.finished_at else "running",
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "samples": self.samples,
+            "remaining_requests": self.remaining_requests,
+        }
+
+
+class ProfileScope:
+    """Marks a request or WebSocket frame as tracked while it is being handled"""
+    __slots__ = ("profiler", "session")
+
+    def __init__(self, profiler: "SamplingProfiler", session: ProfileSession):
+        self.profiler = profiler
+        self.session = session
+
+    def __enter__(self):
+        self.session.active += 1
+
+    def __exit__(self, *exc_info):
+        self.session.active -= 1
+        if self.session.remaining_requests is not None:
+            self.session.remaining_requests -= 1
+            # A request outliving its session must not stop a newer one
+            if self.session.remaining_requests <= 0 and self.profiler.session is self.session:
+                self.profiler.stop()
+        return False
+
+
+def _fold(frame) -> str:
+    """Render a frame's stack root-first as 'func (file:line);...'"""
+    stack = []
+    while frame is not None and len(stack) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+        frame = frame.f_back
+    stack.reverse()
+    return ";".join(stack)
+
+
+class SamplingProfiler:
+    """
+    A background thread samples the stacks of every thread. Each sample counts
+    towards the wall-clock profile; it also counts towards the CPU profile when
+    the sampled thread consumed CPU time since the previous tick.
+    """
+
+    def __init__(self):
+        self.session: Optional[ProfileSession] = None
+        self.last: Optional[ProfileSession] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def scope(self):
+        session = self.session
+        if session is None:
+            return NULL_SCOPE
+        return ProfileScope(self, session)
+
+    def start(self, seconds: Optional[float], requests: Optional[int], interval: float) -> ProfileSession:
+        if self.session is not None:
+            raise RuntimeError("A profile is already being captured")
+
+        session = ProfileSession(seconds, requests, interval)
+        self.session = self.last = session
+        threading.Thread(target=self._sample, args=(session,), name="profiler", daemon=True).start()
+        if seconds is not None:
+            self._timer = asyncio.get_event_loop().call_later(seconds, self.stop)
+        return session
+
+    def stop(self):
+        session = self.session
+        if session is None:
+            return
+        session.finished_at = time.time()
+        self.session = None
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _sample(self, session: ProfileSession):
+        own_id = threading.get_ident()
+        cpu_seen: Dict[int, float] = {}
+
+        while self.session is session:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            # Requests mode only records while a tracked request is in flight
+            if session.remaining_requests is None or session.active > 0:
+                with session.lock:
+                    session.samples += 1
+                    for thread_id, frame in sys._current_frames().items():
+                        if thread_id == own_id:
+                            continue
+                        stack = f"{names.get(thread_id, thread_id)};{_fold(frame)}"
+                        session.wall[stack] += 1
+
+                        try:
+                            cpu_time = time.clock_gettime(time.pthread_getcpuclockid(thread_id))
+                        except (AttributeError, OSError):
+                            continue
+                        if cpu_time > cpu_seen.get(thread_id, cpu_time):
+                            session.cpu[stack] += 1
+                        cpu_seen[thread_id] = cpu_time
+            time.sleep(session.interval)
+
+    def folded(self, kind: str = "wall") -> Optional[str]:
+        """Folded stacks of the last capture ('stack count' per line), for flamegraph.pl or speedscope"""
+        if self.last is None:
+            return None
+        with self.last.lock:
+            counts = self.last.cpu if kind == "cpu" else self.last.wall
+            return "\n".join(f"{stack} {count}" for stack, count in counts.most_common())
+
+profiler = SamplingProfiler()
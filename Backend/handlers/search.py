@@ -0,0 +1,282 @@
+"""
+In-memory inverted index for full-text search over chat history
+"""
+from typing import Dict, List, Optional, Set, NamedTuple, Iterable
+from datetime import datetime
+import asyncio
+import base64
+import bisect
+import heapq
+import json
+import re
+
+from handlers.archive import archive_store
+from schemas.models import ChatMessage
+from config import CHAT_PREFIX, SEARCH_REFRESH_SECONDS
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase word tokens"""
+    return [token.lower() for token in TOKEN_PATTERN.findall(text)]
+
+
+def encode_cursor(timestamp: float, message_id: str) -> str:
+    """Encode the position of the last returned hit as an opaque cursor"""
+    raw = json.dumps([timestamp, message_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """Decode a cursor produced by encode_cursor. Raises ValueError if malformed."""
+    try:
+        timestamp, message_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return float(timestamp), str(message_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+class IndexedMessage(NamedTuple):
+    chat: str
+    message_id: str
+    username: str
+    message: str
+    timestamp: datetime
+    sort_key: float
+
+
+class ChatIndex:
+    """Inverted index for a single chat room"""
+
+    def __init__(self, chat: str):
+        self.chat = chat
+        self.postings: Dict[str, Set[str]] = {}
+        self.terms: List[str] = []
+        self.documents: Dict[str, IndexedMessage] = {}
+        self.by_username: Dict[str, Set[str]] = {}
+
+    def add(self, message: ChatMessage):
+        """Index a single message. Re-adding a known message is a no-op."""
+        if message.message_id in self.documents:
+            return
+
+        doc = IndexedMessage(
+            chat=self.chat,
+            message_id=message.message_id,
+            username=message.username,
+            message=message.message,
+            timestamp=message.timestamp,
+            sort_key=message.timestamp.timestamp()
+        )
+        self.documents[doc.message_id] = doc
+        self.by_username.setdefault(doc.username, set()).add(doc.message_id)
+
+        for term in set(tokenize(doc.message)):
+            posting = self.postings.get(term)
+            if posting is None:
+                posting = self.postings[term] = set()
+                bisect.insort(self.terms, term)
+            posting.add(doc.message_id)
+
+    def _lookup(self, term: str, prefix: bool) -> Set[str]:
+        """Return ids of messages containing the term (or any term starting with it)"""
+        if not prefix:
+            return self.postings.get(term, set())
+
+        matches: Set[str] = set()
+        start = bisect.bisect_left(self.terms, term)
+        for candidate in self.terms[start:]:
+            if not candidate.startswith(term):
+                break
+            matches |= self.postings[candidate]
+        return matches
+
+    def candidates(self, query: str, username: Optional[str] = None) -> Set[str]:
+        """
+        Resolve a query to matching message ids.
+        All terms must match; a trailing '*' turns a term into a prefix match.
+        """
+        sets = []
+        for raw in query.split():
+            prefix = raw.endswith('*')
+            for term in tokenize(raw):
+                sets.append(self._lookup(term, prefix))
+        if not sets:
+            return set()
+
+        if username is not None:
+            sets.append(self.by_username.get(username, set()))
+
+        sets.sort(key=len)
+        result = set(sets[0])
+        for other in sets[1:]:
+            if not result:
+                break
+            result &= other
+        return result
+
+    def hits(
+        self,
+        query: str,
+        username: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        after: Optional[tuple] = None
+    ) -> Iterable[IndexedMessage]:
+        """Yield matching messages that fall inside the time range and after the cursor"""
+        for message_id in self.candidates(query, username):
+            doc = self.documents[message_id]
+            if since is not None and doc.sort_key < since:
+                continue
+            if until is not None and doc.sort_key > until:
+                continue
+            if after is not None and (doc.sort_key, doc.message_id) >= after:
+                continue
+            yield doc
+
+
+class SearchIndex:
+    """
+    Collection of per-chat indexes, updated incrementally and rebuildable from
+    storage. Messages written through other pods are picked up by the periodic
+    refresh; chats not (yet) fully built are tracked in `incomplete`.
+    """
+
+    def __init__(self):
+        self.chats: Dict[str, ChatIndex] = {}
+        self.incomplete: Set[str] = set()
+        self._rebuilding: Dict[str, List[ChatMessage]] = {}
+
+    def add(self, message: ChatMessage, chat: str):
+        """Index a newly created message"""
+        if chat in self._rebuilding:
+            self._rebuilding[chat].append(message)
+        index = self.chats.get(chat)
+        if index is None:
+            index = self.chats[chat] = ChatIndex(chat)
+        index.add(message)
+
+    def search(
+        self,
+        query: str,
+        chats: Optional[List[str]] = None,
+        username: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        cursor: Optional[str] = None,
+        limit: int = 20
+    ) -> tuple:
+        """
+        Search one or more chats, newest first.
+        Returns (hits, next_cursor) where next_cursor is None on the last page.
+        """
+        after = decode_cursor(cursor) if cursor else None
+        since_key = since.timestamp() if since else None
+        until_key = until.timestamp() if until else None
+
+        names = chats if chats is not None else list(self.chats)
+        matches = []
+        for chat in names:
+            index = self.chats.get(chat)
+            if index is None:
+                continue
+            matches.extend(index.hits(query, username, since_key, until_key, after))
+
+        page = heapq.nlargest(limit + 1, matches, key=lambda doc: (doc.sort_key, doc.message_id))
+        next_cursor = None
+        if len(page) > limit:
+            page = page[:limit]
+            last = page[-1]
+            next_cursor = encode_cursor(last.sort_key, last.message_id)
+        return page, next_cursor
+
+    def _build_sync(self, db, chat: str) -> ChatIndex:
+        """Build a fresh index for a chat from its archive segments and table"""
+        index = ChatIndex(chat)
+        for message in archive_store.iter_messages_sync(chat):
+            index.add(message)
+        for message in db.iter_messages_sync(chat):
+            index.add(message)
+        return index
+
+    async def rebuild(self, db, chat: str):
+        """Rebuild the index of a chat from storage without losing concurrent writes"""
+        self._rebuilding[chat] = []
+        try:
+            loop = asyncio.get_event_loop()
+            index = await loop.run_in_executor(None, self._build_sync, db, chat)
+            for message in self._rebuilding[chat]:
+                index.add(message)
+            self.chats[chat] = index
+            self.incomplete.discard(chat)
+        finally:
+            del self._rebuilding[chat]
+
+    async def rebuild_all(self, db):
+        """
+        Rebuild the indexes of every chat. Each chat is reported as incomplete
+        until its own build succeeds, so searches served meanwhile say so.
+        """
+        chats = [table.removeprefix(CHAT_PREFIX) for table in await db.get_chat_tables()]
+        self.incomplete.update(chats)
+        for chat in chats:
+            try:
+                await self.rebuild(db, chat)
+            except Exception as e:
+                # Keep serving what is indexed, but report it as partial until a rebuild succeeds
+                print(f"Failed to build search index for {chat}: {e}")
+
+    def _new_messages_sync(self, db, chat: str) -> List[ChatMessage]:
+        """Messages in the chat's tables that its index does not hold yet"""
+        index = self.chats.get(chat)
+        return [message for message in db.iter_messages_sync(chat) if message.message_id not in index.documents]
+
+    async def refresh(self, db, chat: str):
+        """
+        Add messages written through other pods to a complete index. Only the
+        hot tables are read: archived messages were indexed before they moved.
+        """
+        loop = asyncio.get_event_loop()
+        messages = await loop.run_in_executor(None, self._new_messages_sync, db, chat)
+        index = self.chats[chat]
+        for message in messages:
+            index.add(message)
+
+    async def refresh_all(self, db):
+        """Refresh every complete index and rebuild the chats that have none yet"""
+        for table in await db.get_chat_tables():
+            chat = table.removeprefix(CHAT_PREFIX)
+            try:
+                if chat in self.chats and chat not in self.incomplete:
+                    await self.refresh(db, chat)
+                else:
+                    await self.rebuild(db, chat)
+            except Exception as e:
+                self.incomplete.add(chat)
+                print(f"Failed to refresh search index for {chat}: {e}")
+
+    def incomplete_chats(self, chats: Optional[List[str]] = None) -> List[str]:
+        """Which of the given chats (default: all) only have a partial index"""
+        if chats is None:
+            return sorted(self.incomplete)
+        return [chat for chat in chats if chat in self.incomplete]
+
+search_index = SearchIndex()
+
+async def index_loop(db):
+    """Build the indexes once, then periodically pick up other pods' messages and retry failed chats"""
+    try:
+        await search_index.rebuild_all(db)
+    except Exception as e:
+        print(f"Failed to build search index: {e}")
+    while True:
+        await asyncio.sleep(SEARCH_REFRESH_SECONDS)
+        try:
+            await search_index.refresh_all(db)
+        except Exception as e:
+            print(f"Failed to refresh search index: {e}")
+
+async def init_search(db) -> asyncio.Task:
+    """Build the search index in the background, so startup does not wait for a scan of all history"""
+    return asyncio.create_task(index_loop(db))
@@ -0,0 +1,48 @@
+"""
+Per-user read cursors and unread counts, maintained incrementally:
+every room has a sequence number bumped on each new message, and a
+user's unread count in a room is the distance from their cursor to it
+"""
+from typing import Dict, Optional
+
+
+class UnreadTracker:
+    """
+    Sequences and cursors live in this pod's memory, like the search index,
+    and count the messages written through this pod since it started.
+    A user's cursors start at the sequences current when the user is first
+    seen; rooms that only get messages later count from their first message.
+    """
+
+    def __init__(self):
+        self.sequences: Dict[str, int] = {}
+        self.cursors: Dict[str, Dict[str, int]] = {}
+
+    def message_created(self, room: str) -> int:
+        seq = self.sequences.get(room, 0) + 1
+        self.sequences[room] = seq
+        return seq
+
+    def latest(self, room: str) -> int:
+        return self.sequences.get(room, 0)
+
+    def _user_cursors(self, username: str) -> Dict[str, int]:
+        cursors = self.cursors.get(username)
+        if cursors is None:
+            cursors = self.cursors[username] = dict(self.sequences)
+        return cursors
+
+    def advance(self, username: str, room: str, seq: Optional[int] = None):
+        """Move a user's cursor forward to `seq`, or to the room's newest message"""
+        latest = self.sequences.get(room, 0)
+        seq = latest if seq is None else min(seq, latest)
+        cursors = self._user_cursors(username)
+        if seq > cursors.get(room, 0):
+            cursors[room] = seq
+
+    def counts(self, username: str) -> Dict[str, int]:
+        """Unread message count of every room, one lookup per room"""
+        cursors = self._user_cursors(username)
+        return {room: seq - cursors.get(room, 0) for room, seq in self.sequences.items()}
+
+unread = UnreadTracker()
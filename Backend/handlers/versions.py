@@ -0,0 +1,88 @@
+"""
+Resource versions for conditional GETs: the chat registry, each room's
+newest message and cached table statuses. Versions learned from this pod's
+own writes are exact; changes made through other pods are picked up once
+the cached version is older than VERSION_TTL_SECONDS.
+"""
+from hashlib import blake2b
+from typing import Dict, List, Optional, Tuple
+import time
+
+from schemas.models import ChatMessage
+from config import VERSION_TTL_SECONDS
+
+
+def make_etag(*parts) -> str:
+    return '"' + blake2b(repr(parts).encode(), digest_size=8).hexdigest() + '"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """True when an If-None-Match header lists the given ETag (weak comparison)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+class VersionRegistry:
+    def __init__(self):
+        self._chat_list: Optional[Tuple[float, str]] = None
+        self._active: Dict[str, float] = {}
+        # chat -> (checked_at, (timestamp, message_id) of the newest message)
+        self._rooms: Dict[str, Tuple[float, Optional[tuple]]] = {}
+
+    def _fresh(self, checked_at: float) -> bool:
+        return time.monotonic() - checked_at < VERSION_TTL_SECONDS
+
+    def chat_list_etag(self) -> Optional[str]:
+        """ETag of the chat list, or None when it has to be read again"""
+        if self._chat_list is not None and self._fresh(self._chat_list[0]):
+            return self._chat_list[1]
+        return None
+
+    def observe_chat_list(self, chats: List[str]) -> str:
+        etag = make_etag(sorted(chats))
+        self._chat_list = (time.monotonic(), etag)
+        return etag
+
+    def invalidate_chat_list(self):
+        self._chat_list = None
+
+    def is_active(self, chat: str) -> bool:
+        """True when the chat was recently seen ACTIVE. Other statuses are never cached."""
+        checked_at = self._active.get(chat)
+        return checked_at is not None and self._fresh(checked_at)
+
+    def observe_status(self, chat: str, status: str):
+        if status == "ACTIVE":
+            self._active[chat] = time.monotonic()
+        else:
+            self._active.pop(chat, None)
+
+    def room_etag(self, chat: str, *params) -> Optional[str]:
+        """ETag of a view of a room's history, or None when the room has to be read again"""
+        state = self._rooms.get(chat)
+        if state is None or not self._fresh(state[0]):
+            return None
+        return make_etag(state[1], *params)
+
+    def observe_room(self, chat: str, messages: List[ChatMessage], *params) -> str:
+        """Record the newest message returned by a full read of the room's latest history"""
+        newest = max(((msg.timestamp, msg.message_id) for msg in messages), default=None)
+        state = self._rooms.get(chat)
+        if state is not None and state[1] is not None and (newest is None or state[1] > newest):
+            # A write landed after this read started; keep the newer version
+            return make_etag(newest, *params)
+        self._rooms[chat] = (time.monotonic(), newest)
+        return make_etag(newest, *params)
+
+    def message_written(self, chat: str, message: ChatMessage):
+        """Advance a room's version after this pod wrote a message to it"""
+        state = self._rooms.get(chat)
+        if state is None:
+            return
+        newest = (message.timestamp, message.message_id)
+        if state[1] is None or newest > state[1]:
+            self._rooms[chat] = (state[0], newest)
+
+versions = VersionRegistry()
@@ -2,33 +2,130 @@
 WebSocket connection manager for real-time chat
 """
 from fastapi import WebSocket
-from typing import List, Dict
+from typing import Dict, List, Set, Tuple
+import asyncio
+import json
+import time
+
+
+class Connection:
+    """State of one authenticated socket and the rooms it is subscribed to"""
+    __slots__ = ("websocket", "username", "rooms", "acks", "connected_at")
+
+    def __init__(self, websocket: WebSocket, username: str):
+        self.websocket = websocket
+        self.username = username
+        self.rooms: Set[str] = set()
+        # Rooms whose read cursor only moves on explicit acknowledgements
+        self.acks: Set[str] = set()
+        self.connected_at = time.time()
+
 
 class ConnectionManager:
+    """
+    Registry of live connections indexed by socket, room and username.
+    Every add/remove is O(1); broadcasts iterate an immutable per-room
+    snapshot, so connections joining or leaving mid-broadcast are safe.
+    """
+
     def __init__(self):
-        self.active_connections: Dict[str, List[WebSocket]] = {}
-
-    async def connect(self, websocket: WebSocket, chat: str):
-        """Accept and store a connection within a specific room"""
-        await websocket.accept()
-        if chat not in self.active_connections:
-            self.active_connections[chat] = []
-        self.active_connections[chat].append(websocket)
-
-    def disconnect(self, websocket: WebSocket, chat: str):
-        """Remove a connection from a specific room"""
-        if chat in self.active_connections:
-            self.active_connections[chat].remove(websocket)
-            if not self.active_connections[chat]:
-                del self.active_connections[chat]
-
-    async def broadcast(self, message: dict, chat: str):
+        self.connections: Dict[int, Connection] = {}
+        self.rooms: Dict[str, Dict[int, Connection]] = {}
+        self.users: Dict[str, Dict[int, Connection]] = {}
+        self._snapshots: Dict[str, Tuple[Connection, ...]] = {}
+
+    def register(self, websocket: WebSocket, username: str) -> Connection:
+        """Track an accepted and authenticated socket"""
+        connection = Connection(websocket, username)
+        key = id(websocket)
+        self.connections[key] = connection
+        self.users.setdefault(username, {})[key] = connection
+        return connection
+
+    def join(self, connection: Connection, chat: str):
+        """Subscribe a connection to a room"""
+        connection.rooms.add(chat)
+        self.rooms.setdefault(chat, {})[id(connection.websocket)] = connection
+        self._snapshots.pop(chat, None)
+
+    def leave(self, connection: Connection, chat: str):
+        """Unsubscribe a connection from a room"""
+        connection.rooms.discard(chat)
+        connection.acks.discard(chat)
+        members = self.rooms.get(chat)
+        if members is not None:
+            members.pop(id(connection.websocket), None)
+            if not members:
+                del self.rooms[chat]
+        self._snapshots.pop(chat, None)
+
+    def connect(self, websocket: WebSocket, chat: str, username: str) -> Connection:
+        """Track an authenticated socket within a specific room"""
+        connection = self.register(websocket, username)
+        self.join(connection, chat)
+        return connection
+
+    def disconnect(self, websocket: WebSocket):
+        """Remove a connection from every index it is in"""
+        key = id(websocket)
+        connection = self.connections.pop(key, None)
+        if connection is None:
+            return
+
+        for chat in list(connection.rooms):
+            self.leave(connection, chat)
+
+        sockets = self.users.get(connection.username)
+        if sockets is not None:
+            sockets.pop(key, None)
+            if not sockets:
+                del self.users[connection.username]
+
+    def room_snapshot(self, chat: str) -> Tuple[Connection, ...]:
+        """Immutable view of a room's members, rebuilt only after membership changes"""
+        snapshot = self._snapshots.get(chat)
+        if snapshot is None:
+            snapshot = tuple(self.rooms.get(chat, {}).values())
+            self._snapshots[chat] = snapshot
+        return snapshot
+
+    async def _send(self, connections, payload: str) -> List[Connection]:
+        """
+        Send a pre-serialized payload to many sockets, dropping the ones that fail.
+        Returns the connections it was delivered to.
+        """
+        results = await asyncio.gather(
+            *(connection.websocket.send_text(payload) for connection in connections),
+            return_exceptions=True
+        )
+        delivered = []
+        for connection, result in zip(connections, results):
+            if isinstance(result, Exception):
+                self.disconnect(connection.websocket)
+            else:
+                delivered.append(connection)
+        return delivered
+
+    async def broadcast(self, message: dict, chat: str) -> List[Connection]:
         """Send a message only to participants of a specific room"""
-        if chat in self.active_connections:
-            for connection in self.active_connections[chat]:
-                try:
-                    await connection.send_json(message)
-                except Exception:
-                    pass
-
-manager = ConnectionManager()
\ No newline at end of file
+        connections = self.room_snapshot(chat)
+        if not connections:
+            return []
+        return await self._send(connections, json.dumps(message))
+
+    async def send_to_user(self, message: dict, username: str):
+        """Send a message to every socket of a user, whatever room it is in"""
+        connections = tuple(self.users.get(username, {}).values())
+        if connections:
+            await self._send(connections, json.dumps(message))
+
+    async def disconnect_user(self, username: str, code: int = 1008):
+        """Close every socket of a user, e.g. after deactivation"""
+        for connection in tuple(self.users.get(username, {}).values()):
+            self.disconnect(connection.websocket)
+            try:
+                await connection.websocket.close(code=code)
+            except Exception:
+                pass
+
+manager = ConnectionManager()
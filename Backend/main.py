@@ -7,21 +7,36 @@ from fastapi import FastAPI, Request, status
 from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
 import uvicorn
+import math
 
+from handlers.capacity import CapacityExceededError
+from handlers.admission import AdmissionMiddleware, init_admission
+from handlers.profiler import profiler
 from handlers.logger import init_logger, log_message
 from schemas.schemas import LogMessage
 from handlers.database import init_db
-from routes import auth, chat
+from handlers.search import init_search
+from handlers.archive import init_archive
+from handlers.availability import init_availability
+from routes import auth, chat, admin
 
 # Lifespan context manager
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    await init_db()
+    admission_task = await init_admission()
+    db = await init_db()
     await init_logger()
+    search_task = await init_search(db)
+    retention_task = await init_archive(db)
+    availability_task = await init_availability(db)
     yield
     # Shutdown
-    pass
+    admission_task.cancel()
+    search_task.cancel()
+    availability_task.cancel()
+    if retention_task:
+        retention_task.cancel()
 
 # Create FastAPI app
 app = FastAPI(title="Forum API", lifespan=lifespan)
@@ -47,6 +62,36 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
         content={"detail": errors}
     )
 
+# Handle exhausted DynamoDB capacity
+@app.exception_handler(CapacityExceededError)
+async def capacity_exception_handler(request: Request, exc: CapacityExceededError):
+    """Tell clients explicitly that the backend is throttled and when to retry"""
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Service is temporarily over capacity, please retry"},
+        headers={"Retry-After": str(math.ceil(exc.retry_after))}
+    )
+
+# Monitor session
+@app.middleware("http")
+async def monitor_session(request: Request, call_next):
+    """Middleware to log requests and responses"""
+    with profiler.scope():
+        if request.url.path.startswith("/api/ws") or request.url.path.startswith("/api/token"):
+            return await call_next(request)
+        
+        response = await call_next(request)
+
+        if not request.url.path.startswith("/api/token"):
+            msg = LogMessage.from_middleware(request, response)
+            await log_message(msg.to_message)
+            
+        return response 
+
+# Shed load before any logging or routing work is done.
+# Added before CORS so that rejections still carry CORS headers.
+app.add_middleware(AdmissionMiddleware)
+
 # CORS middleware configuration
 app.add_middleware(
     CORSMiddleware,
@@ -61,24 +106,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Monitor session
-@app.middleware("http")
-async def monitor_session(request: Request, call_next):
-    """Middleware to log requests and responses"""
-    if request.url.path.startswith("/api/ws") or request.url.path.startswith("/api/token"):
-        return await call_next(request)
-    
-    response = await call_next(request)
-
-    if not request.url.path.startswith("/api/token"):
-        msg = LogMessage.from_middleware(request, response)
-        await log_message(msg.to_message)
-        
-    return response 
-
 # Include routers 
 app.include_router(auth.router, tags=["Authentication"])
 app.include_router(chat.router, tags=["Chat"])
+app.include_router(admin.router, tags=["Admin"])
 
 # Root endpoint
 @app.get("/")
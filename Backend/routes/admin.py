@@ -0,0 +1,71 @@
+"""
+Admin routes: runtime metrics and on-demand profiling
+"""
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
+from typing import Literal, Optional
+
+from handlers.auth import get_current_admin_user
+from handlers.coalesce import single_flight
+from handlers.admission import admission
+from handlers.profiler import profiler
+from schemas.models import User
+
+router = APIRouter()
+
+@router.get("/api/admin/metrics")
+async def get_metrics(current_user: User = Depends(get_current_admin_user)):
+    """Get load shedding state and request coalescing counters per DynamoDB read method"""
+    return {
+        "admission": admission.stats(),
+        "coalescing": {
+            "enabled": sorted(single_flight.enabled),
+            "in_flight": len(single_flight.inflight),
+            "methods": single_flight.stats
+        }
+    }
+
+@router.post("/api/admin/profile", status_code=status.HTTP_202_ACCEPTED)
+async def start_profile(
+    seconds: Optional[float] = Query(None, gt=0, le=300),
+    requests: Optional[int] = Query(None, ge=1, le=10000),
+    interval_ms: int = Query(10, ge=1, le=1000),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    Start capturing a sampling profile of this pod for the next `seconds`
+    seconds or the next `requests` HTTP requests / WebSocket frames.
+    """
+    if (seconds is None) == (requests is None):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Specify exactly one of 'seconds' or 'requests'"
+        )
+    try:
+        session = profiler.start(seconds, requests, interval_ms / 1000)
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return session.status()
+
+@router.get("/api/admin/profile")
+async def get_profile(
+    kind: Literal["wall", "cpu"] = "wall",
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    Get the last profile as folded stacks (flamegraph.pl / speedscope input).
+    Returns the capture status while it is still running.
+    """
+    if profiler.last is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No profile captured yet")
+    if profiler.last.finished_at is None:
+        return profiler.last.status()
+    return PlainTextResponse(profiler.folded(kind))
+
+@router.delete("/api/admin/profile")
+async def stop_profile(current_user: User = Depends(get_current_admin_user)):
+    """Stop the running capture early"""
+    profiler.stop()
+    if profiler.last is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No profile captured yet")
+    return profiler.last.status()
@@ -3,10 +3,13 @@ Authentication routes: register, login, and user info
 """
 from fastapi import APIRouter, Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordRequestForm
+from pydantic import EmailStr
 from datetime import timedelta
+from typing import Optional
 
 from handlers.auth import get_password_hash, verify_password, create_access_token, get_current_active_user
-from schemas.schemas import UserCreate, UserResponse, Token, LogMessage
+from schemas.schemas import UserCreate, UserResponse, Token, LogMessage, AvailabilityResponse
+from handlers.availability import availability_index
 from handlers.logger import log_message
 from handlers.database import get_db
 from schemas.models import User
@@ -49,6 +52,33 @@ async def register(user: UserCreate):
         is_active=new_user.is_active
     )
 
+@router.get("/api/register/available", response_model=AvailabilityResponse)
+async def check_availability(username: Optional[str] = None, email: Optional[EmailStr] = None):
+    """
+    Check whether a username and/or email are still free.
+    Definitely-free values are answered from memory; only values that may
+    be taken are looked up in the database.
+    """
+    if username is None and email is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Specify 'username' and/or 'email'"
+        )
+
+    db = get_db()
+    result = AvailabilityResponse()
+    if username is not None:
+        result.username = (
+            not availability_index.username_may_exist(username)
+            or await db.get_user_by_username(username) is None
+        )
+    if email is not None:
+        result.email = (
+            not availability_index.email_may_exist(email)
+            or await db.get_user_by_email(email) is None
+        )
+    return result
+
 @router.post("/api/token", response_model=Token)
 async def login(request: Request, form_data: OAuth2PasswordRequestForm = Depends()):
     """Login and get JWT access token"""
@@ -1,28 +1,85 @@
 """
 Chat routes: message history and WebSocket real-time chat
 """
-from handlers.auth import get_current_active_user
-from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect
+from handlers.auth import get_current_active_user, get_current_admin_user
+from botocore.exceptions import ClientError
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
 from jose import JWTError, jwt
-from typing import List
+from typing import List, Optional
+from datetime import datetime, timezone
+import json
+import re
 
-from schemas.schemas import ChatMessageResponse
+from schemas.schemas import ChatMessageResponse, SearchHit, SearchResponse, UnreadResponse
 from schemas.models import ChatMessage, User
-from handlers.websocket import manager
+from handlers.websocket import manager, Connection
+from handlers.capacity import CapacityExceededError
+from handlers.admission import admission, CRITICAL, NORMAL
+from handlers.profiler import profiler
+from handlers.search import search_index
+from handlers.versions import versions, make_etag, etag_matches
+from handlers.unread import unread
+from handlers.export import export_ndjson, gzip_stream, decode_export_cursor, cursor_tables
 from handlers.database import get_db
 
-from config import SECRET_KEY, ALGORITHM, CHAT_PREFIX
+from config import SECRET_KEY, ALGORITHM, CHAT_PREFIX, MAX_WRITE_SHARDS, MAX_SESSION_ROOMS
+
+ROOM_NAME_PATTERN = re.compile(r"[a-zA-Z0-9_-]+")
 
 router = APIRouter()
 
+def _naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Stored timestamps are naive UTC; convert query parameters given with an offset to match"""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+def _check_room_name(chat: str):
+    """Room names map onto table names, so only the characters allowed in rooms may reach them"""
+    if not ROOM_NAME_PATTERN.fullmatch(chat):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Chat names may only contain letters, digits, '-' and '_'"
+        )
+
+def _not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+def _set_etag(response: Response, etag: str):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+
 @router.get("/api/chat/history/{chat}", response_model=List[ChatMessageResponse])
 async def get_chat_history(
     chat: str,
+    response: Response,
     limit: int = 50,
+    before: Optional[datetime] = None,
+    if_none_match: Optional[str] = Header(None),
 ):
-    """Get chat message history"""
+    """
+    Get chat message history.
+    Pass `before` (the timestamp of the oldest message seen) to page into
+    older history; archived messages are read transparently.
+    Latest history is answered with 304 while the room has no new messages.
+    """
+    before = _naive_utc(before)
+    params = (limit, before.isoformat() if before else None)
+    if before is None:
+        etag = versions.room_etag(chat, *params)
+        if etag is not None and etag_matches(if_none_match, etag):
+            return _not_modified(etag)
+
     db = get_db()
-    messages = await db.get_recent_messages(chat, limit)
+    messages = await db.get_recent_messages(chat, limit, before)
+    if before is None:
+        etag = versions.observe_room(chat, messages, *params)
+    else:
+        etag = make_etag([msg.message_id for msg in messages], *params)
+    if etag_matches(if_none_match, etag):
+        return _not_modified(etag)
+    _set_etag(response, etag)
     
     return [
         ChatMessageResponse(
@@ -34,121 +91,456 @@ async def get_chat_history(
     ]
 
 @router.get("/api/chat/status/{chat}")
-async def get_chat_status(chat: str, current_user: User = Depends(get_current_active_user)):
+async def get_chat_status(
+    chat: str,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_active_user)
+):
     """
     Check if a chat table is 'ACTIVE', 'CREATING', or 'NOT_FOUND'.
+    A recently seen 'ACTIVE' status is answered without reading the tables.
     """
-    db = get_db()
-    status = await db.check_table_status(chat)
-    return {"status": status}
+    if versions.is_active(chat):
+        table_status = "ACTIVE"
+    else:
+        db = get_db()
+        table_status = await db.check_table_status(chat)
+        versions.observe_status(chat, table_status)
+
+    etag = make_etag(table_status)
+    if etag_matches(if_none_match, etag):
+        return _not_modified(etag)
+    _set_etag(response, etag)
+    return {"status": table_status}
 
 @router.get("/api/chat/list", response_model=List[str])
-async def get_chat_list(current_user: User = Depends(get_current_active_user)):
+async def get_chat_list(
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_active_user)
+):
     """Get list of available chats"""
+    etag = versions.chat_list_etag()
+    if etag is not None and etag_matches(if_none_match, etag):
+        return _not_modified(etag)
+
     db = get_db()
     chats = await db.get_chat_tables()
+    etag = versions.observe_chat_list(chats)
+    if etag_matches(if_none_match, etag):
+        return _not_modified(etag)
+    _set_etag(response, etag)
     return chats
 
+@router.get("/api/chat/unread", response_model=UnreadResponse)
+async def get_unread_counts(current_user: User = Depends(get_current_active_user)):
+    """Get the number of unread messages in every room with recent activity"""
+    return UnreadResponse(rooms=unread.counts(current_user.username))
+
 @router.post("/api/chat/create/{chat}")
 async def create_chat(chat: str, current_user: User = Depends(get_current_active_user)):
     """Create a new chat table"""
+    _check_room_name(chat)
     db = get_db()
     await db.create_chat_tables(chat)
     return {"message": f"Chat '{chat}' created successfully."}
 
-@router.websocket("/api/ws/chat/{chat}")
-async def websocket_chat(websocket: WebSocket, chat: str):
-    """WebSocket endpoint for real-time chat"""
+@router.put("/api/chat/shards/{chat}")
+async def set_chat_shards(
+    chat: str,
+    count: int = Query(..., ge=1, le=MAX_WRITE_SHARDS),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    Spread a hot chat's writes over `count` shard tables.
+    New shards are created before writes move to them; lowering the count
+    keeps existing shards readable.
+    """
+    _check_room_name(chat)
     db = get_db()
-    await manager.connect(websocket, chat)
+    write_shards, shard_span = await db.set_write_shards(chat, count)
+    return {"chat": chat, "write_shards": write_shards, "shard_span": shard_span}
 
-    chat_plain_name = chat.removeprefix(CHAT_PREFIX)
-    
+def _run_search(
+    q: str,
+    chats: Optional[List[str]],
+    username: Optional[str],
+    since: Optional[datetime],
+    until: Optional[datetime],
+    cursor: Optional[str],
+    limit: int
+) -> SearchResponse:
+    """Run a query against the search index and build the paged response"""
+    since, until = _naive_utc(since), _naive_utc(until)
     try:
-        token = await websocket.receive_text()
+        hits, next_cursor = search_index.search(
+            q, chats=chats, username=username, since=since, until=until,
+            cursor=cursor, limit=limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    return SearchResponse(
+        results=[
+            SearchHit(
+                chat=hit.chat,
+                message_id=hit.message_id,
+                username=hit.username,
+                message=hit.message,
+                timestamp=hit.timestamp
+            )
+            for hit in hits
+        ],
+        next_cursor=next_cursor,
+        incomplete_chats=search_index.incomplete_chats(chats)
+    )
+
+@router.get("/api/chat/search", response_model=SearchResponse)
+async def search_all_chats(
+    q: str = Query(..., min_length=1),
+    username: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Search messages across all chats, newest first.
+    A trailing '*' on a term matches it as a prefix.
+    """
+    return _run_search(q, None, username, since, until, cursor, limit)
+
+@router.get("/api/chat/search/{chat}", response_model=SearchResponse)
+async def search_chat(
+    chat: str,
+    q: str = Query(..., min_length=1),
+    username: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Search messages of a single chat, newest first"""
+    return _run_search(q, [chat], username, since, until, cursor, limit)
+
+@router.get("/api/chat/export/{chat}")
+async def export_chat(
+    chat: str,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    compress: bool = False,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Stream the full transcript of a chat as NDJSON. Messages are in
+    timestamp order within a page only; sort by timestamp for a time line.
+    Every page is followed by a {"type": "cursor"} line; pass its value as
+    `cursor` to resume an interrupted export.
+    """
+    _check_room_name(chat)
+    db = get_db()
+    # Problems found once streaming has started can no longer change the status code
+    if f"{CHAT_PREFIX}{chat}" not in await db.get_chat_tables():
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chat not found")
+    if await db.check_table_status(chat) != "ACTIVE":
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Chat is not ready yet")
+
+    if cursor:
         try:
-            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-            username = payload.get("sub")
-            if username is None:
-                await websocket.close(code=1008)
-                return
+            state = decode_export_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        # Only resume scans of this chat's own tables
+        if not cursor_tables(state) <= set(await db.chat_table_names(chat)):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+    stream = export_ndjson(db, chat, _naive_utc(since), _naive_utc(until), cursor)
+    filename = f"{chat}.ndjson"
+    media_type = "application/x-ndjson"
+    if compress:
+        stream = gzip_stream(stream)
+        filename += ".gz"
+        media_type = "application/gzip"
+
+    return StreamingResponse(
+        stream,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+def _retry_error(message: str, retry_after: float, room: Optional[str] = None) -> dict:
+    """WebSocket frame telling the client a request was shed and when to retry"""
+    frame = {"type": "error", "message": message, "retry_after": retry_after}
+    if room is not None:
+        frame["room"] = room
+    return frame
+
+def _history_frame(room: str, messages: List[ChatMessage], seq: int) -> dict:
+    return {
+        "type": "history",
+        "room": room,
+        "seq": seq,
+        "messages": [
+            {
+                "username": msg.username,
+                "message": msg.message,
+                "timestamp": msg.timestamp.isoformat()
+            }
+            for msg in messages
+        ]
+    }
+
+async def _authenticate(websocket: WebSocket) -> Optional[str]:
+    """
+    Read the token handshake frame of an accepted socket.
+    Returns the username, or closes the socket and returns None.
+    """
+    token = await websocket.receive_text()
+    db = get_db()
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        username = payload.get("sub")
+        if username is None:
+            await websocket.close(code=1008)
+            return None
+        
+        user = await db.get_user_by_username(username)
+        if user is None or not user.is_active:
+            await websocket.close(code=1008)
+            return None
+    except JWTError:
+        await websocket.close(code=1008)
+        return None
+    except CapacityExceededError:
+        await websocket.close(code=1013)
+        return None
+    return username
+
+async def _send_history(
+    websocket: WebSocket,
+    room: str,
+    limit: int,
+    unavailable_message: str,
+    skip_empty: bool = False
+) -> Optional[int]:
+    """
+    Send a room's recent history, or a retry frame when it cannot be read right now.
+    Returns the room sequence number the history covers, or None on failure.
+    """
+    db = get_db()
+    seq = unread.latest(room)
+    try:
+        messages = await db.get_recent_messages(room, limit)
+    except CapacityExceededError as e:
+        await websocket.send_json(_retry_error(unavailable_message, e.retry_after, room))
+        return None
+    if messages or not skip_empty:
+        await websocket.send_json(_history_frame(room, messages, seq))
+    return seq
+
+async def _post_message(websocket: WebSocket, room: str, username: str, text: str):
+    """Store a new message and broadcast it to every subscriber of the room"""
+    if not admission.admit(CRITICAL):
+        await websocket.send_json(_retry_error("Message was not sent, the server is overloaded. Please retry", admission.retry_after(), room))
+        return
+    
+    db = get_db()
+    chat_message = ChatMessage(username=username, message=text)
+    try:
+        await db.create_message(chat_message, room)
+    except CapacityExceededError as e:
+        await websocket.send_json(_retry_error("Message was not sent, the chat is busy. Please retry", e.retry_after, room))
+        return
+    except ClientError as e:
+        # Fail this message only; a session socket carries other rooms too
+        print(f"Failed to store message in {room}: {e}")
+        message = "Chat does not exist" if e.response['Error']['Code'] == 'ResourceNotFoundException' else "Message was not sent"
+        await websocket.send_json({"type": "error", "room": room, "message": message})
+        return
+    
+    seq = unread.latest(room)
+    unread.advance(username, room, seq)
+    
+    message_data = {
+        "type": "message",
+        "room": room,
+        "seq": seq,
+        "username": username,
+        "message": text,
+        "timestamp": chat_message.timestamp.isoformat()
+    }
+    delivered = await manager.broadcast(message_data, room)
+    for connection in delivered:
+        if room not in connection.acks:
+            unread.advance(connection.username, room, seq)
+
+async def _handle_frame(websocket: WebSocket, room: str, username: str, data: str):
+    """Handle one frame received on a chat WebSocket: a command or a new message"""
+    if data.startswith("/"):
+        command_parts = data.split(maxsplit=1)
+        command = command_parts[0].lower()
+        
+        if command == "/history":
+            limit = 50
+            if len(command_parts) > 1 and command_parts[1].isdigit():
+                limit = int(command_parts[1])
+                limit = min(limit, 200) 
             
-            user = await db.get_user_by_username(username)
-            if user is None or not user.is_active:
-                await websocket.close(code=1008)
+            if not admission.admit(NORMAL):
+                await websocket.send_json(_retry_error("Server is overloaded, please retry", admission.retry_after(), room))
                 return
-        except JWTError:
-            await websocket.close(code=1008)
+            
+            await _send_history(websocket, room, limit, "History is temporarily unavailable, please retry")
             return
         
+        elif command == "/help":
+            await websocket.send_json({
+                "type": "system",
+                "message": "Available commands:\n/history [number] - Get recent messages (default 50, max 200)\n/help - Show this help message"
+            })
+            return
+    
+    await _post_message(websocket, room, username, data)
+
+@router.websocket("/api/ws/chat/{chat}")
+async def websocket_chat(websocket: WebSocket, chat: str):
+    """WebSocket endpoint for real-time chat in a single room"""
+    await websocket.accept()
+
+    room = chat.removeprefix(CHAT_PREFIX)
+    if not ROOM_NAME_PATTERN.fullmatch(room):
+        await websocket.close(code=1008)
+        return
+    
+    try:
+        username = await _authenticate(websocket)
+        if username is None:
+            return
+        
+        manager.connect(websocket, room, username)
         await websocket.send_json({
             "type": "system",
             "message": f"Welcome {username}! You are now connected to the chat."
         })
         
-        recent_messages = await db.get_recent_messages(chat_plain_name, 50)
-        
-        if recent_messages:
-            await websocket.send_json({
-                "type": "history",
-                "messages": [
-                    {
-                        "username": msg.username,
-                        "message": msg.message,
-                        "timestamp": msg.timestamp.isoformat()
-                    }
-                    for msg in recent_messages
-                ]
-            })
+        seq = await _send_history(
+            websocket, room, 50, "History is temporarily unavailable, use /history to retry", skip_empty=True
+        )
+        if seq is not None:
+            unread.advance(username, room, seq)
         
         while True:
             data = await websocket.receive_text()
+            with profiler.scope():
+                await _handle_frame(websocket, room, username, data)
             
-            if data.startswith("/"):
-                command_parts = data.split(maxsplit=1)
-                command = command_parts[0].lower()
-                
-                if command == "/history":
-                    limit = 50
-                    if len(command_parts) > 1 and command_parts[1].isdigit():
-                        limit = int(command_parts[1])
-                        limit = min(limit, 200) 
-                    
-                    history_messages = await db.get_recent_messages(chat_plain_name, limit)
-                    
-                    await websocket.send_json({
-                        "type": "history",
-                        "messages": [
-                            {
-                                "username": msg.username,
-                                "message": msg.message,
-                                "timestamp": msg.timestamp.isoformat()
-                            }
-                            for msg in history_messages
-                        ]
-                    })
-                    continue
-                
-                elif command == "/help":
-                    await websocket.send_json({
-                        "type": "system",
-                        "message": "Available commands:\n/history [number] - Get recent messages (default 50, max 200)\n/help - Show this help message"
-                    })
+    except WebSocketDisconnect:
+        manager.disconnect(websocket)
+    except Exception as e:
+        manager.disconnect(websocket)
+        print(f"WebSocket error: {e}")
+
+async def _handle_session_frame(websocket: WebSocket, connection: Connection, frame: dict):
+    """Handle one JSON frame of a multi-room session"""
+    frame_type = frame.get("type")
+    if frame_type == "unread":
+        await websocket.send_json({"type": "unread", "rooms": unread.counts(connection.username)})
+        return
+    
+    room = frame.get("room")
+    if not isinstance(room, str) or not ROOM_NAME_PATTERN.fullmatch(room):
+        await websocket.send_json({"type": "error", "message": "Missing or invalid 'room'"})
+        return
+    
+    if frame_type == "subscribe":
+        if room not in connection.rooms and len(connection.rooms) >= MAX_SESSION_ROOMS:
+            await websocket.send_json({"type": "error", "room": room, "message": f"Cannot follow more than {MAX_SESSION_ROOMS} rooms"})
+            return
+        manager.join(connection, room)
+        if frame.get("ack"):
+            connection.acks.add(room)
+        await websocket.send_json({"type": "subscribed", "room": room})
+        if admission.admit(NORMAL):
+            seq = await _send_history(websocket, room, 50, "History is temporarily unavailable, send a history frame to retry")
+            if seq is not None and room not in connection.acks:
+                unread.advance(connection.username, room, seq)
+        else:
+            await websocket.send_json(_retry_error("History is temporarily unavailable, send a history frame to retry", admission.retry_after(), room))
+    
+    elif frame_type == "unsubscribe":
+        manager.leave(connection, room)
+        await websocket.send_json({"type": "unsubscribed", "room": room})
+    
+    elif frame_type == "history":
+        limit = frame.get("limit", 50)
+        if not isinstance(limit, int) or limit < 1:
+            limit = 50
+        if not admission.admit(NORMAL):
+            await websocket.send_json(_retry_error("Server is overloaded, please retry", admission.retry_after(), room))
+            return
+        await _send_history(websocket, room, min(limit, 200), "History is temporarily unavailable, please retry")
+    
+    elif frame_type == "ack":
+        seq = frame.get("seq")
+        if seq is not None and not isinstance(seq, int):
+            await websocket.send_json({"type": "error", "room": room, "message": "'seq' must be an integer"})
+            return
+        unread.advance(connection.username, room, seq)
+    
+    elif frame_type == "message":
+        text = frame.get("message")
+        if room not in connection.rooms:
+            await websocket.send_json({"type": "error", "room": room, "message": "Subscribe to the room before posting"})
+        elif not isinstance(text, str) or not text:
+            await websocket.send_json({"type": "error", "room": room, "message": "Missing 'message'"})
+        else:
+            await _post_message(websocket, room, connection.username, text)
+    
+    else:
+        await websocket.send_json({"type": "error", "message": f"Unknown frame type: {frame_type}"})
+
+@router.websocket("/api/ws/session")
+async def websocket_session(websocket: WebSocket):
+    """
+    WebSocket endpoint for a multi-room chat session.
+    The first frame is the token; after that the client sends JSON frames
+    ({"type": "subscribe" | "unsubscribe" | "history" | "message" | "ack", "room": ...})
+    and every room-specific frame it receives carries a "room" field.
+    A room's read cursor follows delivered messages, unless it was subscribed
+    with "ack": true, in which case it only moves on "ack" frames.
+    """
+    await websocket.accept()
+    
+    try:
+        username = await _authenticate(websocket)
+        if username is None:
+            return
+        
+        connection = manager.register(websocket, username)
+        await websocket.send_json({
+            "type": "system",
+            "message": f"Welcome {username}! Subscribe to rooms to start chatting."
+        })
+        await websocket.send_json({"type": "unread", "rooms": unread.counts(username)})
+        
+        while True:
+            data = await websocket.receive_text()
+            with profiler.scope():
+                try:
+                    frame = json.loads(data)
+                except ValueError:
+                    frame = None
+                if not isinstance(frame, dict):
+                    await websocket.send_json({"type": "error", "message": "Frames must be JSON objects"})
                     continue
-            
-            chat_message = ChatMessage(username=username, message=data)
-            await db.create_message(chat_message, chat_plain_name)
-            
-            message_data = {
-                "type": "message",
-                "username": username,
-                "message": data,
-                "timestamp": chat_message.timestamp.isoformat()
-            }
-            await manager.broadcast(message_data, chat)
+                await _handle_session_frame(websocket, connection, frame)
             
     except WebSocketDisconnect:
-        manager.disconnect(websocket, chat)
+        manager.disconnect(websocket)
     except Exception as e:
-        manager.disconnect(websocket, chat)
-        print(f"WebSocket error: {e}")
\ No newline at end of file
+        manager.disconnect(websocket)
+        print(f"WebSocket error: {e}")
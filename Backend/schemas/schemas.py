@@ -4,7 +4,7 @@ Pydantic schemas for request/response validation
 from pydantic import BaseModel, ConfigDict, EmailStr, field_validator
 from fastapi import Request, Response
 from datetime import datetime
-from typing import Optional
+from typing import Optional, List, Dict
 
 
 class UserCreate(BaseModel):
@@ -27,6 +27,11 @@ class UserResponse(BaseModel):
     is_active: bool
 
 
+class AvailabilityResponse(BaseModel):
+    username: Optional[bool] = None
+    email: Optional[bool] = None
+
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -47,6 +52,24 @@ class ChatMessageResponse(BaseModel):
     timestamp: datetime
 
 
+class UnreadResponse(BaseModel):
+    rooms: Dict[str, int]
+
+
+class SearchHit(BaseModel):
+    chat: str
+    message_id: str
+    username: str
+    message: str
+    timestamp: datetime
+
+
+class SearchResponse(BaseModel):
+    results: List[SearchHit]
+    next_cursor: Optional[str] = None
+    incomplete_chats: List[str] = []  # searched chats whose index is still building or failed to build
+
+
 class LogMessage(BaseModel):
     model_config = ConfigDict(arbitrary_types_allowed=True)
 
@@ -0,0 +1,90 @@
+"""
+Bloom filter sizing and rebuilds of the availability index
+"""
+from unittest import mock
+import asyncio
+import math
+import unittest
+
+from handlers import availability as availability_module
+from handlers.availability import AvailabilityIndex, BloomFilter
+
+
+class BloomFilterTest(unittest.TestCase):
+    def test_size_follows_capacity_and_error_rate(self):
+        bloom = BloomFilter(10000, 0.01)
+        # m = -n ln p / (ln 2)^2 bits and k = m/n ln 2 hashes
+        self.assertEqual(bloom.size, math.ceil(-10000 * math.log(0.01) / math.log(2) ** 2))
+        self.assertEqual(bloom.hashes, 7)
+        self.assertEqual(len(bloom.bits), (bloom.size + 7) // 8)
+
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(1000, 0.01)
+        names = [f"user{i}" for i in range(1000)]
+        for name in names:
+            bloom.add(name)
+        self.assertTrue(all(name in bloom for name in names))
+
+    def test_false_positive_rate_stays_near_target(self):
+        bloom = BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom.add(f"user{i}")
+        false_positives = sum(f"other{i}" in bloom for i in range(10000))
+        self.assertLess(false_positives / 10000, 0.03)
+
+
+class FakeDB:
+    """Users table scan that lets a registration land while the scan is running"""
+
+    def __init__(self, index, users, registered_during_scan=None):
+        self.index = index
+        self.users = users
+        self.registered_during_scan = registered_during_scan
+
+    def iter_user_keys_sync(self):
+        if self.registered_during_scan:
+            self.index.add(*self.registered_during_scan)
+        return iter(self.users)
+
+
+class AvailabilityIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = AvailabilityIndex()
+
+    def test_fails_open_until_built(self):
+        self.assertFalse(self.index.ready)
+        self.assertTrue(self.index.username_may_exist("anyone"))
+        self.assertTrue(self.index.email_may_exist("anyone@example.com"))
+
+    def test_rebuild_keeps_registrations_made_during_the_scan(self):
+        db = FakeDB(self.index, [("alice", "alice@example.com")], registered_during_scan=("bob", "Bob@Example.com"))
+        asyncio.run(self.index.rebuild(db))
+
+        self.assertTrue(self.index.ready)
+        self.assertTrue(self.index.username_may_exist("alice"))
+        self.assertTrue(self.index.username_may_exist("bob"))
+        self.assertTrue(self.index.email_may_exist("bob@example.com"))
+        self.assertIsNone(self.index._rebuilding)
+
+    def test_filters_are_sized_for_growth(self):
+        users = [(f"user{i}", f"user{i}@example.com") for i in range(50)]
+        with mock.patch.object(availability_module, 'AVAILABILITY_MIN_CAPACITY', 10):
+            asyncio.run(self.index.rebuild(FakeDB(self.index, users)))
+        self.assertEqual(self.index.usernames.size, BloomFilter(100, availability_module.AVAILABILITY_FALSE_POSITIVE_RATE).size)
+
+    def test_failed_rebuild_keeps_the_previous_filters(self):
+        asyncio.run(self.index.rebuild(FakeDB(self.index, [("alice", "alice@example.com")])))
+        usernames = self.index.usernames
+
+        class BrokenDB:
+            def iter_user_keys_sync(self):
+                raise RuntimeError("scan failed")
+
+        with self.assertRaises(RuntimeError):
+            asyncio.run(self.index.rebuild(BrokenDB()))
+        self.assertIs(self.index.usernames, usernames)
+        self.assertIsNone(self.index._rebuilding)
+
+
+if __name__ == '__main__':
+    unittest.main()
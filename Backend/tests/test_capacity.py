@@ -0,0 +1,204 @@
+"""
+Capacity management against tables larger than one scan page
+"""
+from botocore.exceptions import EndpointConnectionError
+from datetime import datetime, timedelta
+from unittest import mock
+import asyncio
+import unittest
+
+from handlers import capacity as capacity_module
+from handlers.capacity import CapacityManager, CapacityExceededError, READ, WRITE, INTERACTIVE, LIVE
+from handlers.database import DynamoDBClient
+from schemas.models import ChatMessage
+
+ITEM_RCU = 1.0  # 8 KB items, eventually consistent
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+    async def async_sleep(self, seconds):
+        self.now += seconds
+
+
+class LargeTable:
+    """Stands in for a DynamoDBClient whose chat table holds `size` items"""
+
+    def __init__(self, manager: CapacityManager, size: int):
+        self.manager = manager
+        self.size = size
+        self.pages = []
+
+    def _scan_table_page_sync(self, table_name, start_key=None, since=None, until=None, limit=None):
+        start = start_key or 0
+        # Without a Limit DynamoDB stops at 1 MB, i.e. 128 of these items
+        end = min(self.size, start + (limit or 128))
+        response = {
+            'ConsumedCapacity': {'CapacityUnits': (end - start) * ITEM_RCU},
+            'ScannedCount': end - start
+        }
+        self.manager.record(table_name, READ, '_scan_table_page_sync', response)
+        self.pages.append(end - start)
+        return list(range(start, end)), (end if end < self.size else None), (end - start) * ITEM_RCU
+
+
+class LargeTableScanTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.manager = CapacityManager()
+        patches = [
+            mock.patch.object(capacity_module, 'capacity', self.manager),
+            mock.patch('handlers.database.capacity', self.manager),
+            mock.patch.object(capacity_module.time, 'monotonic', self.clock.monotonic),
+            mock.patch.object(capacity_module.time, 'sleep', self.clock.sleep),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_bulk_scan_reads_whole_table(self):
+        table = LargeTable(self.manager, 1000)
+        items = list(DynamoDBClient.iter_table_messages_sync(table, 'chat_big'))
+
+        self.assertEqual(items, list(range(1000)))
+        bucket = self.manager.bucket('chat_big', READ)
+        self.assertTrue(all(page * ITEM_RCU <= bucket.capacity for page in table.pages))
+
+    def test_bulk_page_leaves_room_for_readers(self):
+        table = LargeTable(self.manager, 1000)
+        scan = DynamoDBClient.iter_table_messages_sync(table, 'chat_big')
+        next(scan)
+
+        for priority in (INTERACTIVE, LIVE):
+            result = self.manager.call_sync('chat_big', READ, priority, lambda: 'ok')
+            self.assertEqual(result, 'ok')
+
+
+class HistoryTable:
+    """Stands in for a DynamoDBClient whose chat table holds `size` small messages, one per minute"""
+    scan_table_page = DynamoDBClient.scan_table_page
+    _get_recent_table_messages = DynamoDBClient._get_recent_table_messages
+
+    def __init__(self, manager: CapacityManager, size: int, item_rcu: float):
+        self.manager = manager
+        self.item_rcu = item_rcu
+        start = datetime(2024, 1, 1)
+        # Scans return items in hash order, not by time
+        self.messages = [
+            ChatMessage(message_id=f"m{i:05d}", username="alice", message=str(i), timestamp=start + timedelta(minutes=i))
+            for i in sorted(range(size), key=lambda i: hash(str(i)))
+        ]
+        self.consumed = 0.0
+
+    def _scan_table_page_sync(self, table_name, start_key=None, since=None, until=None, limit=None):
+        start = start_key or 0
+        end = min(len(self.messages), start + (limit or 1000))
+        consumed = (end - start) * self.item_rcu
+        self.manager.record(table_name, READ, '_scan_table_page_sync', {
+            'ConsumedCapacity': {'CapacityUnits': consumed}, 'ScannedCount': end - start
+        })
+        self.consumed += consumed
+        page = [msg for msg in self.messages[start:end] if until is None or msg.timestamp <= until]
+        return page, (end if end < len(self.messages) else None), consumed
+
+
+class DeepHistoryTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.manager = CapacityManager()
+        patches = [
+            mock.patch.object(capacity_module, 'capacity', self.manager),
+            mock.patch('handlers.database.capacity', self.manager),
+            mock.patch.object(capacity_module.time, 'monotonic', self.clock.monotonic),
+            mock.patch.object(capacity_module.asyncio, 'sleep', self.clock.async_sleep),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_paging_past_the_burst_size(self):
+        table = HistoryTable(self.manager, 2000, item_rcu=0.05)
+        before = datetime(2024, 1, 1) + timedelta(minutes=1500)
+        messages = asyncio.run(table._get_recent_table_messages('chat_big', 10, before))
+
+        self.assertEqual([msg.message for msg in messages], [str(i) for i in range(1490, 1500)])
+        self.assertGreater(table.consumed, self.manager.bucket('chat_big', READ).capacity)
+
+    def test_scan_gives_up_after_max_pages(self):
+        table = HistoryTable(self.manager, 2000, item_rcu=0.05)
+        with mock.patch('handlers.database.HISTORY_MAX_SCAN_PAGES', 2):
+            with self.assertRaises(CapacityExceededError):
+                asyncio.run(table._get_recent_table_messages('chat_big', 10, datetime(2025, 1, 1)))
+
+
+class ThrottledBatchTable:
+    """Stands in for a DynamoDBClient whose batch deletes leave items unprocessed `throttled` times"""
+    delete_messages_sync = DynamoDBClient.delete_messages_sync
+
+    def __init__(self, throttled: int):
+        self.throttled = throttled
+        self.deleted = []
+
+    def _delete_batch_sync(self, table_name, message_ids):
+        if self.throttled:
+            self.throttled -= 1
+            self.deleted.extend(message_ids[1:])
+            return message_ids[:1]
+        self.deleted.extend(message_ids)
+        return []
+
+
+class UnprocessedItemsTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.manager = CapacityManager()
+        patches = [
+            mock.patch('handlers.database.capacity', self.manager),
+            mock.patch.object(capacity_module.time, 'monotonic', self.clock.monotonic),
+            mock.patch.object(capacity_module.time, 'sleep', self.clock.sleep),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_unprocessed_items_are_resubmitted(self):
+        table = ThrottledBatchTable(throttled=2)
+        ids = [f"m{i}" for i in range(30)]
+        table.delete_messages_sync('chat_big', ids)
+
+        self.assertEqual(sorted(table.deleted), sorted(ids))
+        bucket = self.manager.bucket('chat_big', WRITE)
+        self.assertLess(bucket.rate, bucket.max_rate)
+
+    def test_persistent_throttling_exhausts_the_retries(self):
+        table = ThrottledBatchTable(throttled=100)
+        with self.assertRaises(CapacityExceededError):
+            table.delete_messages_sync('chat_big', ["m0", "m1"])
+
+
+class NetworkRetryTest(unittest.TestCase):
+    def test_connection_errors_are_retried(self):
+        manager = CapacityManager()
+        attempts = []
+
+        def flaky():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise EndpointConnectionError(endpoint_url='http://dynamodb')
+            return 'ok'
+
+        with mock.patch.object(capacity_module.time, 'sleep'):
+            self.assertEqual(manager.call_sync('chat_main', READ, LIVE, flaky), 'ok')
+        self.assertEqual(len(attempts), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
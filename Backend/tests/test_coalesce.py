@@ -0,0 +1,84 @@
+"""
+Single-flight coalescing of concurrent identical reads
+"""
+import asyncio
+import unittest
+
+from handlers.coalesce import SingleFlight
+
+
+class SingleFlightTest(unittest.TestCase):
+    def setUp(self):
+        self.flight = SingleFlight({"get_user"})
+        self.calls = 0
+
+    def factory(self, result="user", error=None):
+        async def read():
+            self.calls += 1
+            await asyncio.sleep(0.01)
+            if error is not None:
+                raise error
+            return result
+        return read
+
+    def test_concurrent_identical_calls_share_one_read(self):
+        async def run():
+            return await asyncio.gather(*(self.flight.do("get_user", ("alice",), self.factory()) for _ in range(5)))
+
+        self.assertEqual(asyncio.run(run()), ["user"] * 5)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.flight.stats["get_user"], {"calls": 5, "executed": 1, "coalesced": 4})
+        self.assertEqual(self.flight.inflight, {})
+
+    def test_different_keys_are_not_shared(self):
+        async def run():
+            await asyncio.gather(
+                self.flight.do("get_user", ("alice",), self.factory()),
+                self.flight.do("get_user", ("bob",), self.factory()),
+            )
+
+        asyncio.run(run())
+        self.assertEqual(self.calls, 2)
+
+    def test_sequential_calls_read_again(self):
+        async def run():
+            await self.flight.do("get_user", ("alice",), self.factory())
+            await self.flight.do("get_user", ("alice",), self.factory())
+
+        asyncio.run(run())
+        self.assertEqual(self.calls, 2)
+
+    def test_exception_reaches_every_caller(self):
+        async def run():
+            return await asyncio.gather(
+                *(self.flight.do("get_user", ("alice",), self.factory(error=KeyError("gone"))) for _ in range(3)),
+                return_exceptions=True
+            )
+
+        results = asyncio.run(run())
+        self.assertEqual(self.calls, 1)
+        self.assertTrue(all(isinstance(result, KeyError) for result in results))
+        self.assertEqual(self.flight.inflight, {})
+
+    def test_cancelled_caller_does_not_cancel_the_others(self):
+        async def run():
+            first = asyncio.ensure_future(self.flight.do("get_user", ("alice",), self.factory()))
+            second = asyncio.ensure_future(self.flight.do("get_user", ("alice",), self.factory()))
+            await asyncio.sleep(0)
+            first.cancel()
+            return await second
+
+        self.assertEqual(asyncio.run(run()), "user")
+        self.assertEqual(self.calls, 1)
+
+    def test_disabled_methods_are_not_coalesced(self):
+        async def run():
+            await asyncio.gather(*(self.flight.do("get_chat", ("main",), self.factory()) for _ in range(3)))
+
+        asyncio.run(run())
+        self.assertEqual(self.calls, 3)
+        self.assertNotIn("get_chat", self.flight.stats)
+
+
+if __name__ == '__main__':
+    unittest.main()
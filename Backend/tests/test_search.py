@@ -0,0 +1,133 @@
+"""
+Tokenizing, prefix matching, cursor paging and rebuilds of the in-memory search index
+"""
+from datetime import datetime, timedelta
+from unittest import mock
+import asyncio
+import unittest
+
+from handlers import search as search_module
+from handlers.search import SearchIndex, ChatIndex, tokenize, decode_cursor
+from schemas.models import ChatMessage
+
+START = datetime(2024, 1, 1)
+
+
+def message(i: int, text: str, username: str = "alice") -> ChatMessage:
+    return ChatMessage(message_id=f"m{i:03d}", username=username, message=text, timestamp=START + timedelta(minutes=i))
+
+
+class TokenizeTest(unittest.TestCase):
+    def test_lowercases_and_splits_on_punctuation(self):
+        self.assertEqual(tokenize("Hello, World! it's 2024"), ["hello", "world", "it", "s", "2024"])
+
+    def test_keeps_unicode_words(self):
+        self.assertEqual(tokenize("Zażółć gęślą"), ["zażółć", "gęślą"])
+
+
+class ChatIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = ChatIndex("main")
+        self.index.add(message(1, "deploy finished"))
+        self.index.add(message(2, "deployment failed", username="bob"))
+        self.index.add(message(3, "lunch?"))
+
+    def test_all_terms_must_match(self):
+        self.assertEqual(self.index.candidates("deploy finished"), {"m001"})
+        self.assertEqual(self.index.candidates("deploy lunch"), set())
+
+    def test_trailing_star_matches_prefix(self):
+        self.assertEqual(self.index.candidates("deploy"), {"m001"})
+        self.assertEqual(self.index.candidates("deploy*"), {"m001", "m002"})
+
+    def test_username_filter(self):
+        self.assertEqual(self.index.candidates("deploy*", username="bob"), {"m002"})
+
+    def test_readding_a_message_is_a_no_op(self):
+        self.index.add(message(1, "something else entirely"))
+        self.assertEqual(self.index.candidates("something"), set())
+
+
+class SearchPagingTest(unittest.TestCase):
+    def setUp(self):
+        self.search_index = SearchIndex()
+        for i in range(25):
+            self.search_index.add(message(i, f"ping {i}"), "main" if i % 2 else "dev")
+
+    def test_pages_are_newest_first_without_gaps(self):
+        seen = []
+        cursor = None
+        while True:
+            hits, cursor = self.search_index.search("ping", cursor=cursor, limit=10)
+            seen.extend(hit.message_id for hit in hits)
+            if cursor is None:
+                break
+        self.assertEqual(seen, [f"m{i:03d}" for i in reversed(range(25))])
+
+    def test_chat_and_time_filters(self):
+        hits, cursor = self.search_index.search(
+            "ping", chats=["main"], since=START + timedelta(minutes=10), until=START + timedelta(minutes=15)
+        )
+        self.assertEqual([hit.message_id for hit in hits], ["m015", "m013", "m011"])
+        self.assertIsNone(cursor)
+
+    def test_malformed_cursor(self):
+        with self.assertRaises(ValueError):
+            decode_cursor("not-a-cursor")
+        with self.assertRaises(ValueError):
+            self.search_index.search("ping", cursor="bm9wZQ==")
+
+    def test_chats_without_a_build_are_reported(self):
+        self.search_index.incomplete.add("dev")
+        self.assertEqual(self.search_index.incomplete_chats(), ["dev"])
+        self.assertEqual(self.search_index.incomplete_chats(["main"]), [])
+
+
+class FakeDB:
+    """Chat tables held in lists; `broken` chats fail to scan"""
+
+    def __init__(self, tables):
+        self.tables = tables
+        self.broken = set()
+
+    async def get_chat_tables(self):
+        return [f"chat_{chat}" for chat in self.tables]
+
+    def iter_messages_sync(self, chat):
+        if chat in self.broken:
+            raise RuntimeError("scan failed")
+        return iter(list(self.tables[chat]))
+
+
+class RebuildTest(unittest.TestCase):
+    def setUp(self):
+        patch = mock.patch.object(search_module.archive_store, 'iter_messages_sync', return_value=iter(()))
+        self.archive = patch.start()
+        self.addCleanup(patch.stop)
+        self.db = FakeDB({"main": [message(1, "hello")], "dev": [message(2, "hello")]})
+        self.search_index = SearchIndex()
+
+    def test_failed_chats_stay_incomplete_until_rebuilt(self):
+        self.db.broken.add("dev")
+        asyncio.run(self.search_index.rebuild_all(self.db))
+        self.assertEqual(self.search_index.incomplete_chats(), ["dev"])
+
+        self.db.broken.clear()
+        asyncio.run(self.search_index.refresh_all(self.db))
+        self.assertEqual(self.search_index.incomplete_chats(), [])
+        hits, _ = self.search_index.search("hello")
+        self.assertEqual({hit.chat for hit in hits}, {"main", "dev"})
+
+    def test_refresh_adds_other_pods_messages_without_reading_the_archive(self):
+        asyncio.run(self.search_index.rebuild_all(self.db))
+        self.archive.reset_mock()
+        self.db.tables["main"].append(message(3, "written elsewhere"))
+
+        asyncio.run(self.search_index.refresh_all(self.db))
+        hits, _ = self.search_index.search("elsewhere")
+        self.assertEqual([hit.message_id for hit in hits], ["m003"])
+        self.archive.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
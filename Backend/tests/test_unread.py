@@ -0,0 +1,61 @@
+"""
+Read cursors and unread counts of the unread tracker
+"""
+import unittest
+
+from handlers.unread import UnreadTracker
+
+
+class UnreadTrackerTest(unittest.TestCase):
+    def setUp(self):
+        self.tracker = UnreadTracker()
+
+    def test_sequences_count_messages_per_room(self):
+        self.assertEqual([self.tracker.message_created("main") for _ in range(3)], [1, 2, 3])
+        self.assertEqual(self.tracker.message_created("dev"), 1)
+        self.assertEqual(self.tracker.latest("main"), 3)
+        self.assertEqual(self.tracker.latest("unknown"), 0)
+
+    def test_new_users_start_at_the_current_sequences(self):
+        for _ in range(5):
+            self.tracker.message_created("main")
+        self.assertEqual(self.tracker.counts("alice"), {"main": 0})
+
+        self.tracker.message_created("main")
+        self.tracker.message_created("dev")
+        self.assertEqual(self.tracker.counts("alice"), {"main": 1, "dev": 1})
+
+    def test_advance_to_a_sequence_or_the_newest_message(self):
+        self.tracker.counts("alice")
+        for _ in range(4):
+            self.tracker.message_created("main")
+
+        self.tracker.advance("alice", "main", 1)
+        self.assertEqual(self.tracker.counts("alice"), {"main": 3})
+        self.tracker.advance("alice", "main")
+        self.assertEqual(self.tracker.counts("alice"), {"main": 0})
+
+    def test_cursors_never_move_back_or_past_the_newest_message(self):
+        self.tracker.counts("alice")
+        for _ in range(3):
+            self.tracker.message_created("main")
+
+        self.tracker.advance("alice", "main", 3)
+        self.tracker.advance("alice", "main", 1)
+        self.assertEqual(self.tracker.counts("alice"), {"main": 0})
+
+        self.tracker.advance("alice", "main", 99)
+        self.tracker.message_created("main")
+        self.assertEqual(self.tracker.counts("alice"), {"main": 1})
+
+    def test_users_are_independent(self):
+        self.tracker.counts("alice")
+        self.tracker.counts("bob")
+        self.tracker.message_created("main")
+        self.tracker.advance("alice", "main")
+        self.assertEqual(self.tracker.counts("alice"), {"main": 0})
+        self.assertEqual(self.tracker.counts("bob"), {"main": 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
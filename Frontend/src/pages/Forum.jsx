@@ -4,6 +4,9 @@ import { API_URL, WS_URL } from '../config';
 import '../App.css';
 
 const VALID_NAME_REGEX = /^[a-zA-Z0-9-_]+$/;
+const RECONNECT_BASE_DELAY_MS = 1000;
+const RECONNECT_MAX_DELAY_MS = 30000;
+const HELP_TEXT = 'Dostępne komendy:\n/history [liczba] - pokaż ostatnie wiadomości (domyślnie 50, maks. 200)\n/help - pokaż tę pomoc';
 
 function Forum() {
   const [authState, setAuthState] = useState('loading');
@@ -12,16 +15,19 @@ function Forum() {
 
   const messagesEndRef = useRef(null); 
   const [socket, setSocket] = useState(null);
+  const [subscribedRoom, setSubscribedRoom] = useState(null);
   const [messages, setMessages] = useState([]);
   const [newMessage, setNewMessage] = useState('');
   
   const [chats, setChats] = useState([]); 
+  const [unread, setUnread] = useState({});
   const [selectedChat, setSelectedChat] = useState('main');
   const [isModalOpen, setIsModalOpen] = useState(false);
   const [newChatName, setNewChatName] = useState('');
   const [modalError, setModalError] = useState('');
 
   const [isChatReady, setIsChatReady] = useState(false);
+  const selectedChatRef = useRef(selectedChat);
   const [isCreating, setIsCreating] = useState(false);
 
   useEffect(() => {
@@ -144,67 +150,161 @@ function Forum() {
     return () => { isMounted = false; };
   }, [selectedChat, authState]);
 
-  // 5. WebSocket - Only connects if isChatReady is true
-  useEffect(() => {
-    if (authState !== 'active' || !user || !isChatReady) return;
+  const addSystemMessage = useCallback((content) => {
+    setMessages(prev => [...prev, {
+      id: `s-${Date.now()}-${prev.length}`,
+      content,
+      username: 'System',
+      timestamp: new Date().toISOString(),
+      isSystem: true
+    }]);
+  }, []);
 
-    if (!VALID_NAME_REGEX.test(selectedChat)) {
-        console.error("Invalid chat name for WS:", selectedChat);
-        return;
-    }
+  // 5. WebSocket session - one socket per login, rooms are subscriptions.
+  // Reconnects with exponential backoff after overload (1013), errors or restarts.
+  useEffect(() => {
+    if (authState !== 'active' || !user) return;
 
-    setMessages([]); 
     let isMounted = true;
-    const token = localStorage.getItem('token');
-    const ws = new WebSocket(`${WS_URL}/api/ws/chat/${selectedChat}`);
-    
-    ws.onopen = () => {
-      if (isMounted) {
-        setSocket(ws);
-        ws.send(token); 
-      }
-    };
+    let ws = null;
+    let attempt = 0;
+    let retryTimer = null;
 
-    ws.onmessage = (event) => {
-      if (!isMounted) return;
-      try {
-        const data = JSON.parse(event.data);
-        if (data.type === 'history') {
-          setMessages(data.messages.map((msg, idx) => ({
-            id: `h-${idx}-${Date.now()}`, 
-            content: msg.message,
-            username: msg.username,
-            timestamp: msg.timestamp,
-            isOwn: msg.username === user.username
-          })));
-        } 
-        else if (data.type === 'message') {
-          setMessages(prev => [...prev, {
-            id: Date.now(),
-            content: data.message,
-            username: data.username,
-            timestamp: data.timestamp,
-            isOwn: data.username === user.username
-          }]);
+    const connect = () => {
+      const token = localStorage.getItem('token');
+      ws = new WebSocket(`${WS_URL}/api/ws/session`);
+
+      ws.onopen = () => {
+        if (isMounted) {
+          ws.send(token);
+          setSocket(ws);
         }
-      } catch (e) {
-        console.error("WS parse error:", e);
-      }
+      };
+
+      ws.onmessage = (event) => {
+        if (!isMounted) return;
+        try {
+          const data = JSON.parse(event.data);
+          if (data.type === 'system') {
+            // Welcome frame: the session is authenticated
+            attempt = 0;
+            return;
+          }
+          if (data.type === 'unread') {
+            setUnread({ ...data.rooms, [selectedChatRef.current]: 0 });
+            return;
+          }
+          if (data.room && data.room !== selectedChatRef.current) return;
+
+          if (data.type === 'subscribed') {
+            setSubscribedRoom(data.room);
+          }
+          else if (data.type === 'error') {
+            addSystemMessage(data.message);
+          }
+          else if (data.type === 'history') {
+            setMessages(data.messages.map((msg, idx) => ({
+              id: `h-${idx}-${Date.now()}`, 
+              content: msg.message,
+              username: msg.username,
+              timestamp: msg.timestamp,
+              isOwn: msg.username === user.username
+            })));
+          } 
+          else if (data.type === 'message') {
+            setMessages(prev => [...prev, {
+              id: Date.now(),
+              content: data.message,
+              username: data.username,
+              timestamp: data.timestamp,
+              isOwn: data.username === user.username
+            }]);
+          }
+        } catch (e) {
+          console.error("WS parse error:", e);
+        }
+      };
+
+      ws.onclose = (event) => {
+        if (!isMounted) return;
+        setSocket(null);
+        setSubscribedRoom(null);
+        if (event.code === 1008) {
+          // Token rejected
+          localStorage.removeItem('token');
+          setAuthState('unauthenticated');
+          return;
+        }
+        const delay = Math.min(RECONNECT_MAX_DELAY_MS, RECONNECT_BASE_DELAY_MS * 2 ** attempt);
+        attempt += 1;
+        retryTimer = setTimeout(connect, delay / 2 + Math.random() * delay / 2);
+      };
     };
 
+    connect();
+
     return () => {
       isMounted = false;
+      clearTimeout(retryTimer);
       ws.close();
       setSocket(null);
+      setSubscribedRoom(null);
+    };
+  }, [authState, user, addSystemMessage]);
+
+  // 6. Room subscription - Only subscribes if isChatReady is true
+  useEffect(() => {
+    if (!socket || !isChatReady) return;
+
+    if (!VALID_NAME_REGEX.test(selectedChat)) {
+        console.error("Invalid chat name for WS:", selectedChat);
+        return;
+    }
+
+    selectedChatRef.current = selectedChat;
+    setMessages([]);
+    setUnread(prev => ({ ...prev, [selectedChat]: 0 }));
+    socket.send(JSON.stringify({ type: 'subscribe', room: selectedChat }));
+
+    return () => {
+      setSubscribedRoom(null);
+      if (socket.readyState === WebSocket.OPEN) {
+        socket.send(JSON.stringify({ type: 'unsubscribe', room: selectedChat }));
+      }
     };
-  }, [authState, user, selectedChat, isChatReady]);
+  }, [socket, selectedChat, isChatReady]);
+
+  // 7. Unread counts - requested over the session socket, which also sends them on connect
+  useEffect(() => {
+    if (!socket) return;
+
+    const interval = setInterval(() => {
+      if (socket.readyState === WebSocket.OPEN) {
+        socket.send(JSON.stringify({ type: 'unread' }));
+      }
+    }, 5000);
+    return () => clearInterval(interval);
+  }, [socket]);
+
+  const isSubscribed = socket !== null && subscribedRoom === selectedChat;
 
   const sendMessage = useCallback(() => {
-    if (newMessage.trim() && socket && socket.readyState === WebSocket.OPEN) {
-      socket.send(newMessage.trim()); 
-      setNewMessage('');
+    const text = newMessage.trim();
+    // Keep the text until the room is subscribed, so nothing is lost while (re)connecting
+    if (!text || !isSubscribed || socket.readyState !== WebSocket.OPEN) return;
+
+    // Slash commands map to session frames instead of being posted to the room
+    const [command, argument] = text.split(/\s+/, 2);
+    if (command.toLowerCase() === '/history') {
+      const limit = parseInt(argument, 10);
+      socket.send(JSON.stringify({ type: 'history', room: selectedChat, ...(limit > 0 && { limit }) }));
+    } else if (command.toLowerCase() === '/help') {
+      addSystemMessage(HELP_TEXT);
+    } else {
+      socket.send(JSON.stringify({ type: 'message', room: selectedChat, message: text }));
     }
-  }, [socket, newMessage]);
+    setNewMessage('');
+  }, [socket, isSubscribed, newMessage, selectedChat, addSystemMessage]);
 
   const closeModal = () => {
     setIsModalOpen(false);
@@ -232,7 +332,10 @@ function Forum() {
               className={`thread-item ${selectedChat === chat ? 'selected' : ''}`}
               onClick={() => setSelectedChat(chat)}
             >
-              <h3>#{chat}</h3>
+              <h3>
+                #{chat}
+                {unread[chat] > 0 && <span className="unread-badge">{unread[chat]}</span>}
+              </h3>
             </div>
           ))}
         </div>
@@ -249,7 +352,7 @@ function Forum() {
           ) : (
             <>
               {messages.map((msg) => (
-                <div key={msg.id} className={`message ${msg.isOwn ? "own" : ""}`}> 
+                <div key={msg.id} className={`message ${msg.isOwn ? "own" : ""} ${msg.isSystem ? "system" : ""}`}> 
                   <div className="message-header">
                     <span className="username">{msg.username}</span>
                     <span className="timestamp">{new Date(msg.timestamp).toLocaleTimeString()}</span>
@@ -268,10 +371,10 @@ function Forum() {
             value={newMessage}
             onChange={(e) => setNewMessage(e.target.value)}
             onKeyPress={(e) => e.key === 'Enter' && sendMessage()}
-            placeholder={socket ? "Napisz wiadomość..." : "Łączenie..."}
-            disabled={!socket || !isChatReady}
+            placeholder={isSubscribed ? "Napisz wiadomość..." : "Łączenie..."}
+            disabled={!isSubscribed || !isChatReady}
           />
-          <button onClick={sendMessage} disabled={!socket || !isChatReady}>Wyślij</button>
+          <button onClick={sendMessage} disabled={!isSubscribed || !isChatReady}>Wyślij</button>
         </div>
       </main>
 